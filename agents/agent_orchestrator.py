@@ -1,15 +1,16 @@
 from typing import Dict, Any, Optional, Generator
 import streamlit as st
 import logging
-import traceback
 from datetime import datetime, timedelta
 from agents.llm_planner import LLMPlanner
 from agents.graph_builder import GraphBuilder
 from agents.plan_schema import WorkflowState
 from utils.parameter_mapper import ParameterMapper
+from utils.logging_setup import configure_logging
+from config import settings
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+# Configure logging - records are handed to a background listener thread
+configure_logging(settings.LOG_LEVEL, settings.LOG_FORMAT)
 logger = logging.getLogger(__name__)
 
 class AgentOrchestrator:
@@ -34,8 +35,7 @@ class AgentOrchestrator:
             
             logger.info("✅ AgentOrchestrator initialization complete")
         except Exception as e:
-            logger.error(f"❌ Failed to initialize AgentOrchestrator: {str(e)}")
-            logger.error(traceback.format_exc())
+            logger.exception("❌ Failed to initialize AgentOrchestrator: %s", e)
             raise
     
     def process_user_request(self, user_request: str, user_id: str) -> Generator[str, None, None]:
@@ -81,8 +81,12 @@ class AgentOrchestrator:
             # ✅ FIXED: Use simple LangGraph config structure
             config = {
                 "configurable": {
-                    "thread_id": f"user_{user_id}"  # Simple, consistent thread_id
-                }
+                    "thread_id": f"user_{user_id}",  # Simple, consistent thread_id
+                    # Built on this thread - the steps' worker threads can't see the signed-in session
+                    **self.graph_builder.client_config(plan, user_id)
+                },
+                # Independent steps run in parallel - cap how many hit the Google APIs at once
+                "max_concurrency": settings.STEP_MAX_CONCURRENCY
             }
             
             # Initialize workflow state
@@ -139,8 +143,7 @@ class AgentOrchestrator:
                 logger.info("🎉 Request processing completed successfully")
                 
             except Exception as streaming_error:
-                logger.error(f"❌ Error during streaming execution: {str(streaming_error)}")
-                logger.error(traceback.format_exc())
+                logger.exception("❌ Error during streaming execution: %s", streaming_error)
                 yield f"\n❌ **Execution Error**: {str(streaming_error)}"
                 
                 # Try to recover from checkpoint
@@ -161,8 +164,7 @@ class AgentOrchestrator:
                     yield f"❌ **Recovery failed**: {str(recovery_error)}"
             
         except Exception as e:
-            logger.error(f"❌ Error in process_user_request: {str(e)}")
-            logger.error(traceback.format_exc())
+            logger.exception("❌ Error in process_user_request: %s", e)
             yield f"\n❌ **Error**: {str(e)}"
             yield "\nPlease try rephrasing your request or check your Google account connection."
     
@@ -259,8 +261,7 @@ class AgentOrchestrator:
             return context
             
         except Exception as e:
-            logger.error(f"❌ Error getting user context: {str(e)}")
-            logger.error(traceback.format_exc())
+            logger.exception("❌ Error getting user context: %s", e)
             # Return minimal context on error
             return {
                 "user_id": user_id,
@@ -341,8 +342,7 @@ class AgentOrchestrator:
             return final_response
             
         except Exception as e:
-            logger.error(f"❌ Error generating final response: {str(e)}")
-            logger.error(traceback.format_exc())
+            logger.exception("❌ Error generating final response: %s", e)
             return f"Task completed, but encountered an error generating the summary: {str(e)}"
     
     def get_workflow_status(self, user_id: str) -> Dict[str, Any]:
@@ -1,15 +1,283 @@
+import copy
+import functools
+import hashlib
 import json
 import logging
-import traceback
-from typing import Dict, Any, List
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
 from langchain.schema import HumanMessage, SystemMessage
 from langchain_nvidia_ai_endpoints import ChatNVIDIA
+from requests.exceptions import RequestException
 from agents.plan_schema import StepResult, ExecutionStep
 from config import settings
 
+# Optional fast path: msgspec parses and validates the extraction schema in one pass
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+# Optional fast path: orjson parses responses and serializes tool outputs without the stdlib overhead
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Optional lenient parser: handles trailing commas, unquoted keys, single quotes and comments
+try:
+    import json5
+except ImportError:
+    json5 = None
+
 # Configure logging
 logger = logging.getLogger(__name__)
 
+if msgspec is not None:
+    class ExtractionResult(msgspec.Struct):
+        """Typed shape of an extraction response - missing sections default to empty dicts"""
+        extracted_data: Dict[str, Any] = {}
+        for_future_steps: Dict[str, Any] = {}
+        context_updates: Dict[str, Any] = {}
+
+    _EXTRACTION_DECODER = msgspec.json.Decoder(ExtractionResult)
+    _DECODE_ERRORS = (ValueError, msgspec.DecodeError)
+else:
+    _EXTRACTION_DECODER = None
+    _DECODE_ERRORS = (ValueError,)
+
+_EXTRACTION_SECTIONS = ("extracted_data", "for_future_steps", "context_updates")
+
+# JSON schema sent to the NVIDIA endpoint so decoding is constrained to the extraction shape
+_GUIDED_JSON_NVEXT = {
+    "guided_json": {
+        "type": "object",
+        "properties": {section: {"type": "object"} for section in _EXTRACTION_SECTIONS},
+        "required": list(_EXTRACTION_SECTIONS)
+    }
+}
+
+# ChatNVIDIA raises plain Exceptions whose message starts with "[<status>] <title>"
+_LLM_ERROR_STATUS_RE = re.compile(r'^\[(\d{3})\]')
+
+# Statuses the endpoint uses to reject a request body it can't serve - here, the guided_json schema
+_GUIDED_JSON_REJECTED_STATUSES = frozenset({400, 422})
+
+# Extraction calls per response when the endpoint is rate limiting, failing or unreachable
+_LLM_MAX_ATTEMPTS = 3
+_LLM_RETRY_DELAY = 0.5
+
+def _llm_error_status(error: Exception) -> Optional[int]:
+    """HTTP status of a failed ChatNVIDIA call, None when the request never got a response"""
+    match = _LLM_ERROR_STATUS_RE.match(str(error))
+    return int(match.group(1)) if match else None
+
+def _is_transient_llm_error(error: Exception, status: Optional[int]) -> bool:
+    """Rate limiting, server errors and connection failures are worth another attempt"""
+    if status is None:
+        return isinstance(error, RequestException)
+    return status == 429 or status >= 500
+
+# Static head of every extraction prompt - kept byte-identical so server-side prefix caching applies
+_EXTRACTION_PROMPT_PREFIX = """
+Extract data that will be useful for the remaining workflow steps. 
+Focus on identifiers, relationships, and context that future steps might need.
+The completed step, its output and the current workflow state follow below.
+
+Respond with JSON only.
+"""
+
+class _JsonObjectScanner:
+    """Incrementally tracks brace depth to find the first top-level {...} that parses as JSON"""
+    
+    def __init__(self):
+        self.depth = 0
+        self.started = False
+        self.in_string = False
+        self.escaped = False
+        self.consumed = 0
+        self.start = None
+        self._parts = []
+    
+    def feed(self, text: str) -> Optional[int]:
+        """Consume a chunk; return the end offset (in all text fed so far) once a JSON object closes"""
+        
+        self._parts.append(text)
+        for i, ch in enumerate(text):
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == '\\':
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                if self.started:
+                    self.in_string = True
+            elif ch == '{':
+                if not self.started:
+                    self.started = True
+                    self.start = self.consumed + i
+                self.depth += 1
+            elif ch == '}' and self.started:
+                self.depth -= 1
+                if self.depth == 0:
+                    end = self.consumed + i + 1
+                    if self._parses(end):
+                        return end
+                    # Balanced but not JSON (e.g. "{result}" in leading prose) - look for the next object
+                    self.started = False
+        
+        self.consumed += len(text)
+        return None
+    
+    def _parses(self, end: int) -> bool:
+        """Whether the candidate object ending at end is valid JSON"""
+        
+        candidate = ''.join(self._parts)[self.start:end]
+        try:
+            orjson.loads(candidate) if orjson is not None else json.loads(candidate)
+        except ValueError:
+            return False
+        return True
+
+# Bare object keys only (at the start or after "{" or ",") so values like "http://..." are left alone
+_UNQUOTED_KEY_RE = re.compile(r'((?:^|[{,])\s*)([A-Za-z_]\w*)\s*:')
+
+# Double-quoted strings, escapes included - the JSON repairs never rewrite inside them
+_JSON_STRING_RE = re.compile(r'"(?:\\.|[^"\\])*"')
+
+def _repair_outside_strings(content: str) -> str:
+    """Drop trailing commas and quote bare keys, leaving string values untouched"""
+    
+    def repair(segment: str) -> str:
+        segment = segment.replace(',}', '}').replace(',]', ']')
+        return _UNQUOTED_KEY_RE.sub(r'\1"\2":', segment)
+    
+    parts = []
+    position = 0
+    for match in _JSON_STRING_RE.finditer(content):
+        parts.append(repair(content[position:match.start()]))
+        parts.append(match.group(0))
+        position = match.end()
+    parts.append(repair(content[position:]))
+    return ''.join(parts)
+
+# Shared context larger than this is summarized to its top-level keys in the prompt
+_CONTEXT_PROMPT_LIMIT = 8000
+
+# Tool output shown to the LLM keeps its structure but not its bulk - long strings (email bodies)
+# and long lists (file/email listings) are cut before the whole-output size cap applies
+_FIELD_PROMPT_LIMIT = 500
+_LIST_PROMPT_LIMIT = 20
+
+# Markdown code fences, with or without a json language tag
+_FENCE_RE = re.compile(r'```(?:json)?')
+
+# Outermost {...} span of a response - one C-level scan instead of a per-line loop
+_JSON_SPAN_RE = re.compile(r'\{.*\}', re.DOTALL)
+
+def _dumps_compact(value: Any) -> bytes:
+    """Serialize a value as compact JSON bytes"""
+    
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, separators=(",", ":")).encode()
+
+def _dumps_indented(value: Any) -> str:
+    """Serialize a value as 2-space indented JSON for prompts"""
+    
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(value, indent=2)
+
+def _trim_for_prompt(value: Any) -> Any:
+    """Copy of a tool output with long strings shortened and long lists cut, keys and nesting kept"""
+    
+    if isinstance(value, str):
+        if len(value) > _FIELD_PROMPT_LIMIT:
+            return value[:_FIELD_PROMPT_LIMIT] + "... [truncated]"
+        return value
+    if isinstance(value, dict):
+        return {key: _trim_for_prompt(item) for key, item in value.items()}
+    if isinstance(value, list):
+        trimmed = [_trim_for_prompt(item) for item in value[:_LIST_PROMPT_LIMIT]]
+        if len(value) > _LIST_PROMPT_LIMIT:
+            trimmed.append(f"... {len(value) - _LIST_PROMPT_LIMIT} more items")
+        return trimmed
+    return value
+
+def _decode_extraction(text: str) -> Dict[str, Any]:
+    """Parse and validate an extraction response into a dict with all three sections"""
+    
+    if _EXTRACTION_DECODER is not None:
+        return msgspec.structs.asdict(_EXTRACTION_DECODER.decode(text))
+    
+    parsed = orjson.loads(text) if orjson is not None else json.loads(text)
+    if not isinstance(parsed, dict):
+        raise ValueError(f"Expected JSON object, got {type(parsed).__name__}")
+    
+    result = {}
+    for section in _EXTRACTION_SECTIONS:
+        value = parsed.get(section, {})
+        if not isinstance(value, dict):
+            raise ValueError(f"Expected object for '{section}', got {type(value).__name__}")
+        result[section] = value
+    return result
+
+# LRU cache of LLM extractions keyed by (tool, action, digest of raw_output and the rest of the
+# prompt); entries expire after a TTL
+_CACHE_MAX_ENTRIES = 512
+_extraction_cache: "OrderedDict[Tuple[str, str, bytes], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+_extraction_cache_lock = threading.Lock()
+
+def _extraction_cache_key(step_result: StepResult, *prompt_parts: str) -> Optional[Tuple[str, str, bytes]]:
+    """Build the cache key for a step result and the other prompt inputs, or None if its output can't be serialized"""
+    
+    raw_output = step_result['raw_output']
+    try:
+        if orjson is not None:
+            payload = orjson.dumps(raw_output, option=orjson.OPT_SORT_KEYS)
+        else:
+            payload = json.dumps(raw_output, sort_keys=True).encode()
+    except (TypeError, ValueError):
+        return None
+    
+    hasher = hashlib.blake2b(payload, digest_size=16)
+    for part in prompt_parts:
+        # Length prefix keeps ("ab", "c") and ("a", "bc") apart
+        encoded = part.encode()
+        hasher.update(len(encoded).to_bytes(8, "little"))
+        hasher.update(encoded)
+    return (step_result['tool'].value, step_result['action'].value, hasher.digest())
+
+def _get_cached_extraction(key: Tuple[str, str, bytes]) -> Optional[Dict[str, Any]]:
+    """Return a private copy of a live cached extraction and mark it as recently used"""
+    
+    with _extraction_cache_lock:
+        entry = _extraction_cache.get(key)
+        if entry is None:
+            return None
+        expires_at, cached = entry
+        if expires_at <= time.monotonic():
+            del _extraction_cache[key]
+            return None
+        _extraction_cache.move_to_end(key)
+    return copy.deepcopy(cached)
+
+def _store_cached_extraction(key: Tuple[str, str, bytes], extracted: Dict[str, Any]) -> None:
+    """Store a copy of an extraction, evicting the least recently used entry when full"""
+    
+    snapshot = copy.deepcopy(extracted)
+    expires_at = time.monotonic() + settings.EXTRACTION_CACHE_TTL
+    with _extraction_cache_lock:
+        _extraction_cache[key] = (expires_at, snapshot)
+        _extraction_cache.move_to_end(key)
+        if len(_extraction_cache) > _CACHE_MAX_ENTRIES:
+            _extraction_cache.popitem(last=False)
+
 class DataExtractor:
     """Extracts relevant data from tool outputs using LLM with improved error handling"""
     
@@ -19,26 +287,31 @@ class DataExtractor:
         try:
             # Create LLM instance with standardized config
             logger.info("🔧 Creating ChatNVIDIA instance for data extraction")
-            logger.info(f"🔑 Using API key: {'*' * 20}{settings.NVIDIA_API_KEY[-4:] if settings.NVIDIA_API_KEY else 'MISSING'}")
+            logger.info("🔑 Using API key: %s%s", '*' * 20, settings.NVIDIA_API_KEY[-4:] if settings.NVIDIA_API_KEY else 'MISSING')
             
             self.llm = ChatNVIDIA(
                 model="moonshotai/kimi-k2-instruct",
                 api_key=settings.NVIDIA_API_KEY,
-                temperature=0.6,
+                # Structured extraction: low temperature and a tight output budget - the JSON is
+                # well under 1K tokens, and stop sequences cut off any trailing commentary
+                temperature=0.1,
                 top_p=0.9,
-                max_tokens=4096,
+                max_tokens=settings.EXTRACTION_MAX_TOKENS,
+                stop=["\n```", "\n\nNote:", "\n\nExplanation"],
             )
+            
+            # Turned off for the process if the endpoint rejects guided decoding
+            self.guided_json = settings.EXTRACTION_GUIDED_JSON
             logger.info("✅ ChatNVIDIA instance created successfully")
             
-            logger.info("📝 Building system prompt")
-            self.system_prompt = self._build_system_prompt()
-            logger.info(f"✅ System prompt built (length: {len(self.system_prompt)} chars)")
+            # Static prompt is built once per process - identical bytes on every call
+            self.system_prompt = _SYSTEM_PROMPT
+            logger.info("✅ System prompt bound (length: %d chars)", len(self.system_prompt))
             
             logger.info("✅ DataExtractor initialization complete")
             
         except Exception as e:
-            logger.error(f"❌ Failed to initialize DataExtractor: {str(e)}")
-            logger.error(traceback.format_exc())
+            logger.exception("❌ Failed to initialize DataExtractor: %s", e)
             raise
     
     def extract_data(self, step_result: StepResult, completed_step: ExecutionStep, 
@@ -46,15 +319,40 @@ class DataExtractor:
         """Extract useful data from step result for future steps with improved error handling"""
         
         # ✅ FIXED: Access TypedDict fields with bracket notation
-        logger.info(f"🔍 Starting data extraction for step {step_result['step_index']}")
-        logger.info(f"🔧 Tool: {step_result['tool'].value}, Action: {step_result['action'].value}")
-        logger.info(f"📊 Step status: {step_result['status']}")
-        logger.info(f"📋 Remaining steps count: {len(remaining_steps)}")
+        logger.info("🔍 Starting data extraction for step %s", step_result['step_index'])
+        logger.info("🔧 Tool: %s, Action: %s", step_result['tool'].value, step_result['action'].value)
+        logger.info("📊 Step status: %s", step_result['status'])
+        logger.info("📋 Remaining steps count: %d", len(remaining_steps))
         
         try:
+            # Rule-based fast path for known tools - skips the LLM round-trip entirely.
+            # Also taken for the last steps: no later step reads their extraction, and the
+            # rule-based handlers cover the keys the final response uses.
+            raw_output = step_result['raw_output']
+            if ((not settings.LLM_EXTRACT or not remaining_steps)
+                    and step_result['tool'].value in _FALLBACK_HANDLERS
+                    and isinstance(raw_output, dict) and 'data' in raw_output):
+                logger.info("⚡ Using rule-based extraction for step %s", step_result['step_index'])
+                return self._fallback_extraction(step_result)
+            
+            # Rendered once here - both the cache key and the prompt use them
+            remaining_text = self._summarize_remaining_steps(remaining_steps)
+            context_text = self._render_shared_context(shared_context)
+            
+            # The same output under the same step description, remaining steps and context
+            # builds the same prompt - skip the LLM on a cache hit
+            cache_key = _extraction_cache_key(
+                step_result, completed_step['description'], remaining_text, context_text
+            )
+            if cache_key is not None:
+                cached = _get_cached_extraction(cache_key)
+                if cached is not None:
+                    logger.info("♻️ Using cached extraction for step %s", step_result['step_index'])
+                    return cached
+            
             logger.info("✍️ Building extraction prompt")
-            user_prompt = self._build_extraction_prompt(step_result, completed_step, remaining_steps, shared_context)
-            logger.info(f"✅ Extraction prompt built (length: {len(user_prompt)} chars)")
+            user_prompt = self._build_extraction_prompt(step_result, completed_step, remaining_text, context_text)
+            logger.info("✅ Extraction prompt built (length: %d chars)", len(user_prompt))
             
             logger.info("💬 Preparing LangChain messages")
             messages = [
@@ -63,61 +361,115 @@ class DataExtractor:
             ]
             logger.info("✅ Messages prepared for LLM")
             
-            logger.info("🚀 Invoking LLM for data extraction")
-            response = self.llm.invoke(messages)
+            logger.info("🚀 Streaming LLM response for data extraction")
+            response_content = self._stream_json_response(messages)
             logger.info("✅ LLM response received")
             
-            # Extract content from LangChain response
-            response_content = response.content if hasattr(response, 'content') else str(response)
-            logger.info(f"📄 Response content length: {len(response_content)} chars")
-            
-            # ✅ FIX: Better handling of empty responses
-            if not response_content or response_content.strip() == "":
-                logger.warning("⚠️ Empty response from LLM, using fallback extraction")
-                return self._fallback_extraction(step_result)
-            
-            logger.info(f"📄 Response preview: {response_content[:200]}...")
-            
-            # Clean the response content to extract JSON
-            cleaned_content = self._clean_json_response(response_content)
-            logger.info(f"🧹 Cleaned content length: {len(cleaned_content)} chars")
-            
-            # ✅ FIX: Better JSON parsing with multiple attempts
-            extracted_data = self._parse_json_with_fallback(cleaned_content, response_content)
-            
-            if extracted_data:
-                logger.info("✅ JSON parsed successfully")
-                logger.info(f"📊 Extracted data keys: {list(extracted_data.keys())}")
-                
-                # Log key extracted information
-                if 'extracted_data' in extracted_data:
-                    logger.info(f"🔑 Main extracted data: {list(extracted_data['extracted_data'].keys())}")
-                if 'for_future_steps' in extracted_data:
-                    logger.info(f"🔮 Data for future steps: {list(extracted_data['for_future_steps'].keys())}")
-                if 'context_updates' in extracted_data:
-                    logger.info(f"📝 Context updates: {list(extracted_data['context_updates'].keys())}")
-                
-                logger.info(f"✅ Data extraction completed successfully for step {step_result['step_index']}")
-                return extracted_data
-            else:
-                logger.warning("⚠️ JSON parsing failed, using fallback extraction")
-                return self._fallback_extraction(step_result)
+            return self._process_llm_response(step_result, response_content, cache_key)
             
         except Exception as e:
-            logger.error(f"❌ General error in data extraction: {str(e)}")
-            logger.error(traceback.format_exc())
+            logger.exception("❌ General error in data extraction: %s", e)
             # Fallback extraction
             return self._fallback_extraction(step_result)
     
+    def _llm_call_kwargs(self) -> Dict[str, Any]:
+        """Extra request parameters for extraction calls"""
+        return {"nvext": _GUIDED_JSON_NVEXT} if self.guided_json else {}
+    
+    def _stream_json_response(self, messages: List[Any]) -> str:
+        """Stream the LLM response, using schema-guided decoding when the endpoint supports it"""
+        
+        attempt = 0
+        while True:
+            guided = self.guided_json
+            try:
+                return self._read_json_stream(self.llm.stream(messages, **self._llm_call_kwargs()))
+            except Exception as e:
+                status = _llm_error_status(e)
+                
+                # Only a rejected request body means the endpoint can't do guided decoding -
+                # turn it off for the process and resend right away without the schema
+                if guided and status in _GUIDED_JSON_REJECTED_STATUSES:
+                    logger.warning("⚠️ Endpoint rejected guided JSON decoding (HTTP %s), disabling it and retrying", status)
+                    self.guided_json = False
+                    continue
+                
+                attempt += 1
+                if attempt >= _LLM_MAX_ATTEMPTS or not _is_transient_llm_error(e, status):
+                    raise
+                
+                delay = _LLM_RETRY_DELAY * 2 ** (attempt - 1)
+                logger.warning("⏳ Transient LLM error (%s), retrying in %.1fs", status or type(e).__name__, delay)
+                time.sleep(delay)
+    
+    def _read_json_stream(self, stream: Any) -> str:
+        """Consume a response stream and stop reading as soon as the first JSON object closes"""
+        
+        scanner = _JsonObjectScanner()
+        parts = []
+        try:
+            for chunk in stream:
+                text = chunk.content if isinstance(chunk.content, str) else str(chunk.content)
+                parts.append(text)
+                end = scanner.feed(text)
+                if end is not None:
+                    # Object is complete - drop any leading prose and the rest of the generation
+                    logger.info("✂️ JSON object complete, closing LLM stream early")
+                    return ''.join(parts)[scanner.start:end]
+        finally:
+            stream.close()
+        
+        # Stream ended without a balanced object - let the buffered parse attempts deal with it
+        return ''.join(parts)
+    
+    def _process_llm_response(self, step_result: StepResult, response_content: str,
+                              cache_key: Optional[Tuple[str, str, bytes]]) -> Dict[str, Any]:
+        """Turn an LLM response into extracted data, falling back to rule-based extraction"""
+        
+        logger.info("📄 Response content length: %d chars", len(response_content))
+        
+        # ✅ FIX: Better handling of empty responses
+        if not response_content or response_content.strip() == "":
+            logger.warning("⚠️ Empty response from LLM, using fallback extraction")
+            return self._fallback_extraction(step_result)
+        
+        logger.info("📄 Response preview: %s...", response_content[:200])
+        
+        # Clean the response content to extract JSON
+        cleaned_content = self._clean_json_response(response_content)
+        logger.info("🧹 Cleaned content length: %d chars", len(cleaned_content))
+        
+        # ✅ FIX: Better JSON parsing with multiple attempts
+        extracted_data = self._parse_json_with_fallback(cleaned_content, response_content)
+        
+        if extracted_data:
+            logger.info("✅ JSON parsed successfully")
+            
+            # Log key extracted information (all sections are guaranteed by _decode_extraction)
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("📊 Extracted data keys: %s", list(extracted_data.keys()))
+                logger.info("🔑 Main extracted data: %s", list(extracted_data['extracted_data'].keys()))
+                logger.info("🔮 Data for future steps: %s", list(extracted_data['for_future_steps'].keys()))
+                logger.info("📝 Context updates: %s", list(extracted_data['context_updates'].keys()))
+        
+            if cache_key is not None:
+                _store_cached_extraction(cache_key, extracted_data)
+        
+            logger.info("✅ Data extraction completed successfully for step %s", step_result['step_index'])
+            return extracted_data
+        else:
+            logger.warning("⚠️ JSON parsing failed, using fallback extraction")
+            return self._fallback_extraction(step_result)
+        
     def _parse_json_with_fallback(self, cleaned_content: str, original_content: str) -> Dict[str, Any]:
         """Parse JSON with multiple fallback strategies"""
         
         # Attempt 1: Parse cleaned content
         try:
             logger.info("🔄 Attempt 1: Parsing cleaned JSON response")
-            return json.loads(cleaned_content)
-        except json.JSONDecodeError as e:
-            logger.warning(f"⚠️ Attempt 1 failed: {str(e)}")
+            return _decode_extraction(cleaned_content)
+        except _DECODE_ERRORS as e:
+            logger.warning("⚠️ Attempt 1 failed: %s", e)
         
         # Attempt 2: Extract JSON from original response
         try:
@@ -125,25 +477,35 @@ class DataExtractor:
             json_str = self._extract_json_from_text(original_content)
             
             if json_str:
-                logger.info(f"🔍 Extracted JSON: {json_str[:200]}...")
-                return json.loads(json_str)
+                logger.info("🔍 Extracted JSON: %s...", json_str[:200])
+                return _decode_extraction(json_str)
             else:
                 logger.warning("❌ No JSON boundaries found in response")
                 
-        except json.JSONDecodeError as e:
-            logger.warning(f"⚠️ Attempt 2 failed: {str(e)}")
+        except _DECODE_ERRORS as e:
+            logger.warning("⚠️ Attempt 2 failed: %s", e)
         except Exception as e:
-            logger.warning(f"⚠️ Attempt 2 exception: {str(e)}")
+            logger.warning("⚠️ Attempt 2 exception: %s", e)
+        
+        # Attempt 3: Lenient JSON5 parse, re-validated through the strict decoder
+        if json5 is not None:
+            try:
+                logger.info("🧩 Attempt 3: Parsing with lenient JSON5 parser")
+                return _decode_extraction(json.dumps(json5.loads(cleaned_content)))
+            except _DECODE_ERRORS as e:
+                logger.warning("⚠️ Attempt 3 failed: %s", e)
+            except Exception as e:
+                logger.warning("⚠️ Attempt 3 exception: %s", e)
         
-        # Attempt 3: Try to fix common JSON issues
+        # Attempt 4: Try to fix common JSON issues
         try:
-            logger.info("🔧 Attempt 3: Trying to fix common JSON issues")
+            logger.info("🔧 Attempt 4: Trying to fix common JSON issues")
             fixed_json = self._fix_common_json_issues(cleaned_content)
-            return json.loads(fixed_json)
-        except json.JSONDecodeError as e:
-            logger.warning(f"⚠️ Attempt 3 failed: {str(e)}")
+            return _decode_extraction(fixed_json)
+        except _DECODE_ERRORS as e:
+            logger.warning("⚠️ Attempt 4 failed: %s", e)
         except Exception as e:
-            logger.warning(f"⚠️ Attempt 3 exception: {str(e)}")
+            logger.warning("⚠️ Attempt 4 exception: %s", e)
         
         logger.error("❌ All JSON parsing attempts failed")
         return None
@@ -151,12 +513,8 @@ class DataExtractor:
     def _fix_common_json_issues(self, content: str) -> str:
         """Fix common JSON formatting issues"""
         
-        # Remove trailing commas
-        content = content.replace(',}', '}').replace(',]', ']')
-        
-        # Fix missing quotes around keys (simple cases)
-        import re
-        content = re.sub(r'(\w+):', r'"\1":', content)
+        # Remove trailing commas and fix missing quotes around keys (simple cases) - outside string values only
+        content = _repair_outside_strings(content)
         
         # Ensure content starts and ends with braces
         content = content.strip()
@@ -170,37 +528,12 @@ class DataExtractor:
     def _clean_json_response(self, content: str) -> str:
         """Clean LLM response to extract pure JSON"""
         
-        # Remove markdown code blocks
-        content = content.replace('```json', '').replace('```', '')
-        
-        # Remove common prefixes and explanations
-        lines = content.split('\n')
-        cleaned_lines = []
-        json_started = False
-        
-        for line in lines:
-            stripped = line.strip()
-            
-            # Skip explanation lines before JSON
-            if not json_started:
-                if stripped.startswith('{'):
-                    json_started = True
-                    cleaned_lines.append(line)
-                elif stripped.startswith('"') and ('extracted_data' in stripped or 'intent' in stripped):
-                    # Sometimes JSON starts without opening brace on first line
-                    json_started = True
-                    cleaned_lines.append('{')
-                    cleaned_lines.append(line)
-                # Skip lines that look like explanations
-                elif any(word in stripped.lower() for word in ['here', 'based', 'analysis', 'extracted', 'summary']):
-                    continue
-            else:
-                cleaned_lines.append(line)
-                # Stop at closing brace if we find one at the start of a line
-                if stripped == '}' and len(cleaned_lines) > 2:
-                    break
+        # Remove markdown code blocks, then keep only the outermost JSON object
+        content = _FENCE_RE.sub('', content)
+        match = _JSON_SPAN_RE.search(content)
         
-        return '\n'.join(cleaned_lines).strip()
+        # No braces at all - hand back the text so _fix_common_json_issues can still wrap it
+        return match.group(0) if match else content.strip()
     
     def _extract_json_from_text(self, text: str) -> str:
         """Extract JSON object from text that might contain other content"""
@@ -214,7 +547,8 @@ class DataExtractor:
         
         return None
     
-    def _build_system_prompt(self) -> str:
+    @staticmethod
+    def _build_system_prompt() -> str:
         logger.info("📝 Building data extraction system prompt")
         prompt = """
 You are a data extraction agent for multi-step Google API workflows.
@@ -266,64 +600,78 @@ CRITICAL REQUIREMENTS:
         logger.info("✅ Data extraction system prompt built")
         return prompt
 
+    def _summarize_remaining_steps(self, remaining_steps: List[ExecutionStep]) -> str:
+        """Render the remaining-steps block of the extraction prompt"""
+        
+        if not remaining_steps:
+            return "None"
+        return "\n".join(
+            f"Step {step['step_index']}: {step['tool'].value} - {step['action'].value}"
+            for step in remaining_steps
+        )
+    
+    def _render_shared_context(self, shared_context: Dict[str, Any]) -> str:
+        """Render the shared-context block of the extraction prompt, keys only when it is too large"""
+        
+        if not shared_context:
+            return "{}"
+        
+        context_text = _dumps_indented(shared_context)
+        if len(context_text) > _CONTEXT_PROMPT_LIMIT:
+            logger.info("📦 Shared context is %d chars, sending top-level keys only", len(context_text))
+            return f"(too large to include, available keys: {', '.join(map(str, shared_context))})"
+        return context_text
+    
     def _build_extraction_prompt(self, step_result: StepResult, completed_step: ExecutionStep,
-                                remaining_steps: List[ExecutionStep], shared_context: Dict[str, Any]) -> str:
+                                remaining_text: str, context_text: str) -> str:
         
         # ✅ FIXED: Access TypedDict fields with bracket notation
-        logger.info(f"✍️ Building extraction prompt for step {step_result['step_index']}")
+        logger.info("✍️ Building extraction prompt for step %s", step_result['step_index'])
         
         try:
-            remaining_summary = []
-            for step in remaining_steps:
-                remaining_summary.append(f"Step {step['step_index']}: {step['tool'].value} - {step['action'].value}")
+            # ✅ FIX: Truncate large outputs to prevent prompt size issues - the step result in
+            # state keeps the full output for later tool calls, only the prompt gets the trimmed copy
+            raw_output = _trim_for_prompt(step_result['raw_output'])
+            if isinstance(raw_output, dict):
+                # One compact serialization both measures the output and supplies the truncated data
+                output_blob = _dumps_compact(raw_output)
+                if len(output_blob) > 10000:
+                    # Keep only essential parts for large outputs
+                    raw_output = {
+                        "success": raw_output.get("success"),
+                        "message": raw_output.get("message"),
+                        "data": output_blob[:5000].decode(errors="ignore") + "... [truncated]"
+                    }
+                    logger.info("📊 Truncated large output from %d bytes", len(output_blob))
             
-            logger.info(f"📋 Built summary of {len(remaining_summary)} remaining steps")
-            
-            # ✅ FIX: Truncate large outputs to prevent prompt size issues
-            raw_output = step_result['raw_output']
-            if isinstance(raw_output, dict) and len(str(raw_output)) > 10000:
-                # Keep only essential parts for large outputs
-                truncated_output = {
-                    "success": raw_output.get("success"),
-                    "message": raw_output.get("message"),
-                    "data": str(raw_output.get("data", {}))[:5000] + "... [truncated]"
-                }
-                logger.info(f"📊 Truncated large output from {len(str(raw_output))} to {len(str(truncated_output))} chars")
-                raw_output = truncated_output
-            
-            prompt = f"""
+            # Static instructions first so the endpoint's prefix cache covers them; per-call data last
+            prompt = _EXTRACTION_PROMPT_PREFIX + f"""
 COMPLETED STEP:
 Step {step_result['step_index']}: {step_result['tool'].value} - {step_result['action'].value}
 Description: {completed_step['description']}
 
 TOOL OUTPUT:
-{json.dumps(raw_output, indent=2)}
+{_dumps_indented(raw_output)}
 
 REMAINING WORKFLOW STEPS:
-{chr(10).join(remaining_summary) if remaining_summary else "None"}
+{remaining_text}
 
 CURRENT SHARED CONTEXT:
-{json.dumps(shared_context, indent=2)}
-
-Extract data that will be useful for the remaining workflow steps. 
-Focus on identifiers, relationships, and context that future steps might need.
-
-Respond with JSON only.
+{context_text}
 """
             logger.info("✅ Extraction prompt built successfully")
             return prompt
             
         except Exception as e:
-            logger.error(f"❌ Error building extraction prompt: {str(e)}")
-            logger.error(traceback.format_exc())
+            logger.exception("❌ Error building extraction prompt: %s", e)
             raise
 
     def _fallback_extraction(self, step_result: StepResult) -> Dict[str, Any]:
         """Enhanced fallback extraction when LLM fails"""
         
         # ✅ FIXED: Access TypedDict fields with bracket notation
-        logger.warning(f"⚠️ Using fallback extraction for step {step_result['step_index']}")
-        logger.info(f"🔧 Tool: {step_result['tool'].value}")
+        logger.warning("⚠️ Using fallback extraction for step %s", step_result['step_index'])
+        logger.info("🔧 Tool: %s", step_result['tool'].value)
         
         try:
             extracted = {
@@ -332,142 +680,25 @@ Respond with JSON only.
                 "context_updates": {}
             }
             
-            # Enhanced extraction based on tool type
-            if step_result['tool'].value == "gmail_tool":
-                logger.info("📧 Processing Gmail tool fallback extraction")
-                
-                raw_output = step_result['raw_output']
-                if "data" in raw_output:
-                    data = raw_output["data"]
-                    
-                    # Extract emails data
-                    if "emails" in data and isinstance(data["emails"], list):
-                        emails = data["emails"]
-                        if emails:
-                            # Extract email addresses from 'from' field
-                            email_addresses = []
-                            subjects = []
-                            message_ids = []
-                            
-                            for email in emails:
-                                if email.get("from"):
-                                    email_addresses.append(email["from"])
-                                if email.get("subject"):
-                                    subjects.append(email["subject"])
-                                if email.get("id"):
-                                    message_ids.append(email["id"])
-                            
-                            if email_addresses:
-                                extracted["extracted_data"]["email_addresses"] = email_addresses
-                                extracted["for_future_steps"]["discovered_contacts"] = email_addresses
-                                logger.info(f"📧 Extracted {len(email_addresses)} email addresses")
-                            
-                            if subjects:
-                                extracted["extracted_data"]["email_subjects"] = subjects
-                                logger.info(f"📝 Extracted {len(subjects)} email subjects")
-                            
-                            if message_ids:
-                                extracted["extracted_data"]["message_ids"] = message_ids
-                                logger.info(f"🆔 Extracted {len(message_ids)} message IDs")
-                            
-                            # Create email summary for future steps
-                            if len(emails) > 0:
-                                summary = f"Found {len(emails)} emails"
-                                if subjects:
-                                    top_subjects = subjects[:3]  # Top 3 subjects
-                                    summary += f" with subjects: {', '.join(top_subjects)}"
-                                extracted["for_future_steps"]["email_summary"] = summary
-                                logger.info(f"📊 Created email summary: {summary[:100]}...")
-            
-            elif step_result['tool'].value == "calendar_tool":
-                logger.info("📅 Processing Calendar tool fallback extraction")
-                
-                raw_output = step_result['raw_output']
-                if "data" in raw_output:
-                    data = raw_output["data"]
-                    
-                    # Extract meeting/event data
-                    if "meet_link" in data:
-                        extracted["extracted_data"]["meeting_link"] = data["meet_link"]
-                        extracted["for_future_steps"]["meeting_link"] = data["meet_link"]
-                        logger.info("🔗 Extracted meeting link")
-                    
-                    if "event_id" in data:
-                        extracted["extracted_data"]["event_id"] = data["event_id"]
-                        logger.info("📅 Extracted event ID")
-                    
-                    if "attendees" in data and isinstance(data["attendees"], list):
-                        attendee_emails = [att.get("email") for att in data["attendees"] if att.get("email")]
-                        if attendee_emails:
-                            extracted["extracted_data"]["attendee_emails"] = attendee_emails
-                            extracted["for_future_steps"]["meeting_attendees"] = attendee_emails
-                            logger.info(f"👥 Extracted {len(attendee_emails)} attendee emails")
-                    
-                    # Extract event details
-                    if "event_details" in data:
-                        details = data["event_details"]
-                        meeting_info = {}
-                        if details.get("title"):
-                            meeting_info["title"] = details["title"]
-                        if details.get("start_time"):
-                            meeting_info["start_time"] = details["start_time"]
-                        if details.get("location"):
-                            meeting_info["location"] = details["location"]
-                        
-                        if meeting_info:
-                            extracted["for_future_steps"]["meeting_details"] = meeting_info
-                            logger.info(f"📝 Extracted meeting details: {list(meeting_info.keys())}")
-            
-            elif step_result['tool'].value == "drive_tool":
-                logger.info("📁 Processing Drive tool fallback extraction")
-                
-                raw_output = step_result['raw_output']
-                if "data" in raw_output:
-                    data = raw_output["data"]
-                    
-                    # Extract file data
-                    if "file_id" in data:
-                        extracted["extracted_data"]["file_id"] = data["file_id"]
-                        extracted["for_future_steps"]["files_to_attach"] = [data["file_id"]]
-                        logger.info("📁 Extracted file ID")
-                    
-                    if "web_view_link" in data:
-                        extracted["extracted_data"]["share_link"] = data["web_view_link"]
-                        logger.info("🔗 Extracted share link")
-                    
-                    if "filename" in data:
-                        extracted["extracted_data"]["filename"] = data["filename"]
-                        logger.info(f"📄 Extracted filename: {data['filename']}")
-                    
-                    # Extract files list
-                    if "files" in data and isinstance(data["files"], list):
-                        files = data["files"]
-                        if files:
-                            file_names = [f.get("name") for f in files if f.get("name")]
-                            file_ids = [f.get("id") for f in files if f.get("id")]
-                            
-                            if file_names:
-                                extracted["extracted_data"]["file_names"] = file_names
-                                logger.info(f"📄 Extracted {len(file_names)} file names")
-                            
-                            if file_ids:
-                                extracted["extracted_data"]["file_ids"] = file_ids
-                                extracted["for_future_steps"]["available_files"] = file_ids
-                                logger.info(f"🆔 Extracted {len(file_ids)} file IDs")
+            # Rule-based extraction, dispatched by tool
+            handler = _FALLBACK_HANDLERS.get(step_result['tool'].value)
+            raw_output = step_result['raw_output']
+            if handler is not None and "data" in raw_output:
+                handler(raw_output["data"], extracted)
             
             # Add general context updates
             if step_result['status'] == "completed":
                 extracted["context_updates"]["last_successful_action"] = f"{step_result['tool'].value}_{step_result['action'].value}"
                 extracted["context_updates"]["workflow_progress"] = f"Step {step_result['step_index']} completed successfully"
             
-            logger.info(f"✅ Fallback extraction completed for step {step_result['step_index']}")
-            logger.info(f"📊 Fallback extracted data: {list(extracted['extracted_data'].keys())}")
+            logger.info("✅ Fallback extraction completed for step %s", step_result['step_index'])
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("📊 Fallback extracted data: %s", list(extracted['extracted_data'].keys()))
             
             return extracted
             
         except Exception as e:
-            logger.error(f"❌ Error in fallback extraction: {str(e)}")
-            logger.error(traceback.format_exc())
+            logger.exception("❌ Error in fallback extraction: %s", e)
             # Return empty structure if even fallback fails
             return {
                 "extracted_data": {},
@@ -476,4 +707,154 @@ Respond with JSON only.
                     "extraction_error": str(e),
                     "step_status": step_result['status']
                 }
-            }
\ No newline at end of file
+            }
+
+def _extract_gmail(data: Dict[str, Any], extracted: Dict[str, Any]) -> None:
+    """Rule-based extraction from a Gmail tool output's data payload"""
+    
+    logger.info("📧 Processing Gmail tool fallback extraction")
+    
+    # Sent message - the final response reports it from shared_context
+    if "message_id" in data:
+        extracted["extracted_data"]["message_id"] = data["message_id"]
+        extracted["for_future_steps"]["message_id"] = data["message_id"]
+        logger.info("🆔 Extracted sent message ID")
+    
+    # Extract emails data
+    if "emails" in data and isinstance(data["emails"], list):
+        emails = data["emails"]
+        if emails:
+            # Extract email addresses from 'from' field
+            email_addresses = []
+            subjects = []
+            message_ids = []
+            
+            # Single pass, one lookup per field
+            for email in emails:
+                sender = email.get("from")
+                subject = email.get("subject")
+                message_id = email.get("id")
+                if sender:
+                    email_addresses.append(sender)
+                if subject:
+                    subjects.append(subject)
+                if message_id:
+                    message_ids.append(message_id)
+            
+            if email_addresses:
+                extracted["extracted_data"]["email_addresses"] = email_addresses
+                extracted["for_future_steps"]["discovered_contacts"] = email_addresses
+                logger.info("📧 Extracted %d email addresses", len(email_addresses))
+            
+            if subjects:
+                extracted["extracted_data"]["email_subjects"] = subjects
+                logger.info("📝 Extracted %d email subjects", len(subjects))
+            
+            if message_ids:
+                extracted["extracted_data"]["message_ids"] = message_ids
+                logger.info("🆔 Extracted %d message IDs", len(message_ids))
+            
+            # Create email summary for future steps
+            if len(emails) > 0:
+                summary = f"Found {len(emails)} emails"
+                if subjects:
+                    top_subjects = subjects[:3]  # Top 3 subjects
+                    summary += f" with subjects: {', '.join(top_subjects)}"
+                extracted["for_future_steps"]["email_summary"] = summary
+                logger.info("📊 Created email summary: %s...", summary[:100])
+
+def _extract_calendar(data: Dict[str, Any], extracted: Dict[str, Any]) -> None:
+    """Rule-based extraction from a Calendar tool output's data payload"""
+    
+    logger.info("📅 Processing Calendar tool fallback extraction")
+    
+    # Extract meeting/event data
+    if "meet_link" in data:
+        extracted["extracted_data"]["meeting_link"] = data["meet_link"]
+        extracted["for_future_steps"]["meeting_link"] = data["meet_link"]
+        logger.info("🔗 Extracted meeting link")
+    
+    if "event_id" in data:
+        extracted["extracted_data"]["event_id"] = data["event_id"]
+        extracted["for_future_steps"]["event_id"] = data["event_id"]
+        logger.info("📅 Extracted event ID")
+    
+    if "attendees" in data and isinstance(data["attendees"], list):
+        attendee_emails = [email for email in (att.get("email") for att in data["attendees"]) if email]
+        if attendee_emails:
+            extracted["extracted_data"]["attendee_emails"] = attendee_emails
+            extracted["for_future_steps"]["meeting_attendees"] = attendee_emails
+            logger.info("👥 Extracted %d attendee emails", len(attendee_emails))
+    
+    # Extract event details
+    if "event_details" in data:
+        details = data["event_details"]
+        meeting_info = {}
+        if details.get("title"):
+            meeting_info["title"] = details["title"]
+        if details.get("start_time"):
+            meeting_info["start_time"] = details["start_time"]
+        if details.get("location"):
+            meeting_info["location"] = details["location"]
+        
+        if meeting_info:
+            extracted["for_future_steps"]["meeting_details"] = meeting_info
+            logger.info("📝 Extracted meeting details: %s", list(meeting_info.keys()))
+
+def _extract_drive(data: Dict[str, Any], extracted: Dict[str, Any]) -> None:
+    """Rule-based extraction from a Drive tool output's data payload"""
+    
+    logger.info("📁 Processing Drive tool fallback extraction")
+    
+    # Extract file data
+    if "file_id" in data:
+        extracted["extracted_data"]["file_id"] = data["file_id"]
+        extracted["for_future_steps"]["file_id"] = data["file_id"]
+        extracted["for_future_steps"]["files_to_attach"] = [data["file_id"]]
+        logger.info("📁 Extracted file ID")
+    
+    if "web_view_link" in data:
+        extracted["extracted_data"]["share_link"] = data["web_view_link"]
+        logger.info("🔗 Extracted share link")
+    
+    if "filename" in data:
+        extracted["extracted_data"]["filename"] = data["filename"]
+        logger.info("📄 Extracted filename: %s", data['filename'])
+    
+    # Extract files list
+    if "files" in data and isinstance(data["files"], list):
+        files = data["files"]
+        if files:
+            # Single pass over the files list, one lookup per field
+            file_names = []
+            file_ids = []
+            for f in files:
+                name = f.get("name")
+                file_id = f.get("id")
+                if name:
+                    file_names.append(name)
+                if file_id:
+                    file_ids.append(file_id)
+            
+            if file_names:
+                extracted["extracted_data"]["file_names"] = file_names
+                logger.info("📄 Extracted %d file names", len(file_names))
+            
+            if file_ids:
+                extracted["extracted_data"]["file_ids"] = file_ids
+                extracted["for_future_steps"]["available_files"] = file_ids
+                logger.info("🆔 Extracted %d file IDs", len(file_ids))
+
+# Tool name -> rule-based extractor used by _fallback_extraction
+_FALLBACK_HANDLERS = {
+    "gmail_tool": _extract_gmail,
+    "calendar_tool": _extract_calendar,
+    "drive_tool": _extract_drive,
+}
+
+_SYSTEM_PROMPT = DataExtractor._build_system_prompt()
+
+@functools.lru_cache(maxsize=1)
+def get_extractor() -> DataExtractor:
+    """Shared DataExtractor so the LLM client and its connection pool are reused across workflows"""
+    return DataExtractor()
@@ -1,551 +1,609 @@
+import functools
+import inspect
 import logging
-import traceback
-from typing import Dict, Any
-from agents.plan_schema import StepResult, ToolType, ActionType
+import re
+import threading
+import time
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import Dict, Any, List, Tuple, Union
+from google.auth.exceptions import RefreshError
+from googleapiclient.errors import HttpError
+from agents.plan_schema import (
+    ExecutionStep, StepResult, ToolType, ActionType, step_result_from_output, failed_step_result,
+    retryable_step_result
+)
 from tools.gmail_tool import GmailTool
 from tools.calendar_tool import CalendarTool
 from tools.drive_tool import DriveTool
 from utils.parameter_mapper import ParameterMapper
+from config import settings
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# ParameterMapper is stateless, so every node shares one
+_PARAM_MAPPER = ParameterMapper()
+
+# Google API statuses worth retrying (rate limiting and server-side failures)
+_TRANSIENT_HTTP_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+def _retry_after(error: HttpError) -> float:
+    """Seconds the API asked us to wait before retrying - 1 when it sent no usable Retry-After"""
+    try:
+        return max(float(error.resp.get('retry-after', 1)), 0.0)
+    except (TypeError, ValueError):
+        return 1.0
+
+def _count(value: Any) -> int:
+    """Number of recipients/attendees in a value that may be a single item or a list"""
+    return len(value) if isinstance(value, list) else 1
+
+@functools.lru_cache(maxsize=None)
+def _accepted_kwargs(method) -> frozenset:
+    """Keyword arguments an unbound tool method takes after self and google_client"""
+    return frozenset(list(inspect.signature(method).parameters)[2:])
+
+def _filter_kwargs(method, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Drop parameters the tool method doesn't accept instead of letting the call raise TypeError"""
+    
+    accepted = _accepted_kwargs(method)
+    unexpected = params.keys() - accepted
+    if not unexpected:
+        return params
+    
+    logger.warning("⚠️ Dropping parameters %s does not accept: %s", method.__name__, sorted(unexpected))
+    return {key: value for key, value in params.items() if key in accepted}
+
+# {{name}} placeholders in step parameters
+_TEMPLATE_RE = re.compile(r"\{\{(\w+)\}\}")
+
+@functools.lru_cache(maxsize=512)
+def compile_template(template: str) -> Tuple[Union[str, Tuple[str]], ...]:
+    """Split a template into literal strings and (name,) placeholder segments"""
+    
+    segments = []
+    position = 0
+    for match in _TEMPLATE_RE.finditer(template):
+        if match.start() > position:
+            segments.append(template[position:match.start()])
+        segments.append((match.group(1),))
+        position = match.end()
+    if position < len(template):
+        segments.append(template[position:])
+    return tuple(segments)
+
+def render_template(template: str, values: Dict[str, Any]) -> str:
+    """Fill {{name}} placeholders from values in one pass, leaving unknown names untouched"""
+    
+    return "".join(
+        segment if isinstance(segment, str)
+        else str(values[segment[0]]) if segment[0] in values
+        else "{{" + segment[0] + "}}"
+        for segment in compile_template(template)
+    )
+
 class ExecutionNode:
     """Base class for tool execution nodes with parameter mapping"""
     
+    # Google API service for this node
+    DISPLAY_NAME = None
+    SERVICE_NAME = None
+    SERVICE_VERSION = None
+    
     def __init__(self, auth_manager):
         self.auth_manager = auth_manager
-        self.parameter_mapper = ParameterMapper()
-        logger.info(f"🔧 Initialized {self.__class__.__name__} with ParameterMapper")
+        self.parameter_mapper = _PARAM_MAPPER
+        
+        # Authenticated clients per worker thread - httplib2 connections aren't thread-safe
+        self._client_cache = threading.local()
+        logger.info("🔧 Initialized %s with ParameterMapper", self.__class__.__name__)
     
-    def execute(self, step_index: int, tool: ToolType, action: ActionType, 
-                context: Dict[str, Any]) -> StepResult:
-        """Execute tool action and return result as TypedDict"""
-        raise NotImplementedError
-
-class GmailNode(ExecutionNode):
-    """Gmail tool execution node with enhanced parameter mapping"""
+    def _get_client(self, user_id: str):
+        """Get an authenticated client for this node's service, reusing a recent one built on this thread"""
+        
+        cache = self._client_cache.__dict__
+        key = (self.SERVICE_NAME, self.SERVICE_VERSION, user_id)
+        now = time.monotonic()
+        
+        # Logout or a revoked refresh token must take effect even while a client is cached
+        if not self.auth_manager.is_authenticated(user_id):
+            cache.pop(key, None)
+            return None
+        
+        entry = cache.get(key)
+        if entry is not None and entry[1] > now:
+            logger.debug("♻️ Reusing cached %s client", self.SERVICE_NAME)
+            return entry[0]
+        
+        client = self.auth_manager.get_authenticated_client(self.SERVICE_NAME, self.SERVICE_VERSION, user_id)
+        if client:
+            cache[key] = (client, now + settings.GOOGLE_CLIENT_CACHE_TTL)
+        return client
     
-    def __init__(self, auth_manager):
-        super().__init__(auth_manager)
-        logger.info("📧 Creating GmailTool instance")
-        self.tool = GmailTool()
-        logger.info("✅ GmailNode initialized successfully")
+    def _evict_client(self, user_id: str):
+        """Drop this thread's cached client so the next call re-authenticates"""
+        self._client_cache.__dict__.pop((self.SERVICE_NAME, self.SERVICE_VERSION, user_id), None)
     
     def execute(self, step_index: int, tool: ToolType, action: ActionType, 
-                context: Dict[str, Any]) -> StepResult:
+                context: Dict[str, Any], client=None) -> StepResult:
+        """Execute tool action and return result as TypedDict, with the client built for this step if given"""
         
-        logger.info(f"📧 Executing Gmail step {step_index}: {action.value}")
+        debug = logger.isEnabledFor(logging.DEBUG)
+        name = self.DISPLAY_NAME
+        logger.info("⚡ Executing %s step %s: %s", name, step_index, action.value)
         
         try:
             # Get authenticated client
-            logger.info(f"🔐 Getting authenticated Gmail client for user: {context.get('user_id', 'unknown')}")
-            client = self.auth_manager.get_authenticated_client('gmail', 'v1', context['user_id'])
+            if client is None:
+                logger.debug("🔐 Getting authenticated %s client for user: %s", name, context.get('user_id', 'unknown'))
+                client = self._get_client(context['user_id'])
             
             if not client:
-                logger.error("❌ Gmail authentication failed - no client returned")
-                raise Exception("Gmail authentication failed")
+                logger.error("❌ %s authentication failed - no client returned", name)
+                raise Exception(f"{name} authentication failed")
             
-            logger.info("✅ Gmail client authenticated successfully")
+            logger.debug("✅ %s client authenticated successfully", name)
             
-            # Prepare and map parameters with enhanced error handling
-            logger.info("⚙️ Preparing and mapping parameters for Gmail action")
+            # Prepare and map parameters
+            logger.debug("⚙️ Preparing and mapping parameters for %s action", name)
             params = self._prepare_parameters(action, context)
-            logger.info(f"✅ Parameters prepared and mapped: {list(params.keys())}")
+            if debug:
+                logger.debug("✅ Parameters prepared and mapped: %s", list(params.keys()))
             
-            # Execute action with parameter validation
-            logger.info(f"🚀 Executing Gmail action: {action.value}")
+            # Execute action
+            logger.debug("🚀 Executing %s action: %s", name, action.value)
             result = self._call_tool_method(action, client, params)
-            logger.info(f"✅ Gmail action completed: {result.get('success', False)}")
+            logger.debug("✅ %s action completed: %s", name, result.get('success', False))
             
             if result.get('success'):
-                logger.info("✅ Gmail step completed successfully")
+                logger.info("✅ %s step completed successfully", name)
                 if 'data' in result:
-                    logger.info(f"📊 Result data keys: {list(result['data'].keys()) if isinstance(result['data'], dict) else 'non-dict data'}")
+                    if debug:
+                        logger.debug("📊 Result data keys: %s", list(result['data'].keys()) if isinstance(result['data'], dict) else 'non-dict data')
             else:
-                logger.error(f"❌ Gmail step failed: {result.get('error', 'Unknown error')}")
+                logger.error("❌ %s step failed: %s", name, result.get('error', 'Unknown error'))
             
             # ✅ FIXED: Return StepResult as TypedDict
-            return {
-                "step_index": step_index,
-                "tool": tool,
-                "action": action,
-                "status": "completed" if result.get("success") else "failed",
-                "raw_output": result,
-                "extracted_data": {},
-                "error_message": result.get("error") if not result.get("success") else None
-            }
+            return step_result_from_output(step_index, tool, action, result)
+            
+        except RefreshError as e:
+            # Refresh token revoked or expired - a cached client would keep failing
+            logger.error("🔐 %s credentials could not be refreshed in step %s: %s", name, step_index, e)
+            self._evict_client(context['user_id'])
+            return failed_step_result(step_index, tool, action, f"{name} authorization expired - please sign in again")
+            
+        except HttpError as e:
+            status = e.resp.status
+            if status in _TRANSIENT_HTTP_STATUSES:
+                logger.warning("⏳ Transient %s API error in step %s: HTTP %s %s", name, step_index, status, e.reason)
+                return retryable_step_result(
+                    step_index, tool, action, f"{name} API temporarily unavailable (HTTP {status})", _retry_after(e)
+                )
+            logger.error("❌ %s API error in step %s: HTTP %s %s", name, step_index, status, e.reason)
+            return failed_step_result(step_index, tool, action, f"{name} API error (HTTP {status}): {e.reason}")
             
         except Exception as e:
-            logger.error(f"❌ Exception in Gmail step {step_index}: {str(e)}")
-            logger.error(traceback.format_exc())
+            logger.exception("❌ Exception in %s step %s: %s", name, step_index, e)
             
             # ✅ FIXED: Return failed StepResult as TypedDict
-            return {
-                "step_index": step_index,
-                "tool": tool,
-                "action": action,
-                "status": "failed",
-                "raw_output": {},
-                "extracted_data": {},
-                "error_message": str(e)
-            }
+            return failed_step_result(step_index, tool, action, str(e))
+    
+    def _prepare_parameters(self, action: ActionType, context: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the tool method's keyword arguments for this action"""
+        raise NotImplementedError
+    
+    def _call_tool_method(self, action: ActionType, client, params: Dict[str, Any]):
+        """Call the tool method for this action"""
+        raise NotImplementedError
+
+class GmailNode(ExecutionNode):
+    """Gmail tool execution node with enhanced parameter mapping"""
+    
+    DISPLAY_NAME = 'Gmail'
+    SERVICE_NAME = 'gmail'
+    SERVICE_VERSION = 'v1'
+    
+    # Unbound GmailTool method for each supported action
+    _DISPATCH = {
+        ActionType.SEND_EMAIL: GmailTool.send_email,
+        ActionType.READ_EMAILS: GmailTool.read_recent_emails,
+        ActionType.SEARCH_EMAILS: GmailTool.search_emails_by_filters,
+        ActionType.GET_THREADS: GmailTool.get_email_threads
+    }
+    
+    # Keyword arguments each Gmail tool method accepts - built once, read-only
+    _VALID_PARAMS = MappingProxyType({
+        ActionType.SEND_EMAIL: frozenset({'to', 'subject', 'body', 'cc', 'bcc', 'attachments'}),
+        ActionType.READ_EMAILS: frozenset({'max_results', 'query', 'include_attachments'}),
+        ActionType.SEARCH_EMAILS: frozenset({'sender', 'date_range', 'keywords', 'has_attachment', 'include_attachments', 'max_results'}),
+        ActionType.GET_THREADS: frozenset({'thread_id', 'query', 'include_attachments'})
+    })
+    
+    def __init__(self, auth_manager):
+        super().__init__(auth_manager)
+        logger.info("📧 Creating GmailTool instance")
+        self.tool = GmailTool()
+        logger.info("✅ GmailNode initialized successfully")
     
     def _prepare_parameters(self, action: ActionType, context: Dict[str, Any]) -> Dict[str, Any]:
         """Prepare parameters for tool method call with enhanced parameter mapping"""
         
-        logger.info(f"⚙️ Preparing Gmail parameters for action: {action.value}")
+        debug = logger.isEnabledFor(logging.DEBUG)
+        logger.debug("⚙️ Preparing Gmail parameters for action: %s", action.value)
         
+        base_params = context.get("step_parameters", {})
         try:
-            base_params = context.get("step_parameters", {})
             shared_context = context.get("shared_context", {})
             
-            logger.info(f"📋 Base parameters before mapping: {list(base_params.keys())}")
-            logger.info(f"📊 Shared context keys: {list(shared_context.keys())}")
+            # Nothing to map and nothing to resolve from earlier steps
+            if not base_params and not shared_context:
+                return {}
+            
+            if debug:
+                logger.debug("📋 Base parameters before mapping: %s", list(base_params.keys()))
+                logger.debug("📊 Shared context keys: %s", list(shared_context.keys()))
             
             # Apply parameter mapping first
-            logger.info("🔄 Applying parameter mapping")
+            logger.debug("🔄 Applying parameter mapping")
             mapped_params = self.parameter_mapper.map_gmail_params(base_params)
-            logger.info(f"✅ Parameters after mapping: {list(mapped_params.keys())}")
+            if debug:
+                logger.debug("✅ Parameters after mapping: %s", list(mapped_params.keys()))
             
             # ✅ FIX: Validate parameters for specific actions
             validated_params = self._validate_action_parameters(action, mapped_params)
-            logger.info(f"✅ Parameters after validation: {list(validated_params.keys())}")
+            if debug:
+                logger.debug("✅ Parameters after validation: %s", list(validated_params.keys()))
             
             # Smart parameter resolution from context
             if action == ActionType.SEND_EMAIL:
-                logger.info("📧 Processing SEND_EMAIL parameters")
+                logger.debug("📧 Processing SEND_EMAIL parameters")
                 
                 # If 'to' is not specified, try to get from shared context
                 if "to" not in validated_params and "meeting_attendees" in shared_context:
                     validated_params["to"] = shared_context["meeting_attendees"]
-                    logger.info(f"✅ Added recipients from shared context: {len(validated_params['to']) if isinstance(validated_params['to'], list) else 1}")
+                    if debug:
+                        logger.debug("✅ Added recipients from shared context: %s", _count(validated_params['to']))
                 
-                # If subject/body reference meeting details
-                if "meeting_details" in shared_context:
-                    meeting = shared_context["meeting_details"]
-                    logger.info("🔄 Processing meeting details templates")
-                    
-                    if "{{meeting_title}}" in validated_params.get("subject", ""):
-                        old_subject = validated_params["subject"]
-                        validated_params["subject"] = validated_params["subject"].replace("{{meeting_title}}", meeting.get("title", "Meeting"))
-                        logger.info(f"📝 Updated subject template: {old_subject} -> {validated_params['subject']}")
+                # If subject/body reference meeting details - most emails carry no placeholders at all
+                meeting = shared_context.get("meeting_details")
+                if meeting is not None:
+                    template_values = None
+                    for field in ("subject", "body"):
+                        template = validated_params.get(field)
+                        if not isinstance(template, str) or "{{" not in template:
+                            continue
+                        
+                        # Built on the first field that actually has placeholders
+                        if template_values is None:
+                            logger.debug("🔄 Processing meeting details templates")
+                            template_values = {
+                                "meeting_title": meeting.get("title", "Meeting"),
+                                "meeting_link": shared_context.get("meeting_link", "")
+                            }
                         
-                    if "{{meeting_link}}" in validated_params.get("body", ""):
-                        meeting_link = shared_context.get("meeting_link", "")
-                        old_body = validated_params["body"]
-                        validated_params["body"] = validated_params["body"].replace("{{meeting_link}}", meeting_link)
-                        logger.info(f"🔗 Updated body with meeting link: {len(meeting_link)} chars")
+                        rendered = render_template(template, template_values)
+                        validated_params[field] = rendered
+                        if debug:
+                            logger.debug("📝 Rendered %s template (%s -> %s chars)", field, len(template), len(rendered))
             
-            logger.info(f"✅ Gmail parameters fully prepared: {list(validated_params.keys())}")
+            if debug:
+                logger.debug("✅ Gmail parameters fully prepared: %s", list(validated_params.keys()))
             return validated_params
             
         except Exception as e:
-            logger.error(f"❌ Error preparing Gmail parameters: {str(e)}")
-            logger.error(traceback.format_exc())
-            return context.get("step_parameters", {})
+            logger.exception("❌ Error preparing Gmail parameters: %s", e)
+            # Copy so the tool call can't mutate the plan's own parameter dict
+            return dict(base_params)
     
     def _validate_action_parameters(self, action: ActionType, params: Dict[str, Any]) -> Dict[str, Any]:
         """Validate parameters for specific Gmail actions"""
         
-        logger.info(f"🔍 Validating parameters for action: {action.value}")
+        logger.debug("🔍 Validating parameters for action: %s", action.value)
+        
+        if not params:
+            return params
         
         try:
-            validated_params = params.copy()
-            
-            # Define valid parameters for each action
-            valid_params = {
-                ActionType.SEND_EMAIL: ['to', 'subject', 'body', 'cc', 'bcc', 'attachments'],
-                ActionType.READ_EMAILS: ['max_results', 'query', 'include_attachments'],
-                ActionType.SEARCH_EMAILS: ['sender', 'date_range', 'keywords', 'has_attachment', 'include_attachments', 'max_results'],
-                ActionType.GET_THREADS: ['thread_id', 'query', 'include_attachments']
-            }
+            allowed_params = self._VALID_PARAMS.get(action)
+            if allowed_params is None:
+                logger.warning("⚠️ No validation rules for action: %s", action.value)
+                return params
             
-            if action in valid_params:
-                allowed_params = valid_params[action]
-                
-                # Remove invalid parameters
-                invalid_params = []
-                for param_key in list(validated_params.keys()):
-                    if param_key not in allowed_params:
-                        invalid_params.append(param_key)
-                        validated_params.pop(param_key)
-                
-                if invalid_params:
-                    logger.warning(f"⚠️ Removed invalid parameters for {action.value}: {invalid_params}")
-                
-                logger.info(f"✅ Validation complete for {action.value}: {list(validated_params.keys())}")
-            else:
-                logger.warning(f"⚠️ No validation rules for action: {action.value}")
+            # Remove invalid parameters - the common case has none and keeps the mapper's dict as-is
+            invalid_params = params.keys() - allowed_params
+            if not invalid_params:
+                return params
             
-            return validated_params
+            logger.warning("⚠️ Removed invalid parameters for %s: %s", action.value, sorted(invalid_params))
+            return {key: value for key, value in params.items() if key in allowed_params}
             
         except Exception as e:
-            logger.error(f"❌ Error validating parameters: {str(e)}")
+            logger.error("❌ Error validating parameters: %s", e)
             return params
     
     def _call_tool_method(self, action: ActionType, client, params: Dict[str, Any]):
         """Call appropriate tool method with enhanced error handling"""
         
-        logger.info(f"🔧 Calling Gmail tool method for action: {action.value}")
-        logger.info(f"📋 Final parameters: {list(params.keys())}")
+        logger.debug("🔧 Calling Gmail tool method for action: %s", action.value)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("📋 Final parameters: %s", list(params.keys()))
         
         try:
-            if action == ActionType.SEND_EMAIL:
-                logger.info("📧 Calling send_email method")
-                result = self.tool.send_email(client, **params)
-            elif action == ActionType.READ_EMAILS:
-                logger.info("📬 Calling read_recent_emails method")
-                result = self.tool.read_recent_emails(client, **params)
-            elif action == ActionType.SEARCH_EMAILS:
-                logger.info("🔍 Calling search_emails_by_filters method")
-                result = self.tool.search_emails_by_filters(client, **params)
-            elif action == ActionType.GET_THREADS:
-                logger.info("🧵 Calling get_email_threads method")
-                result = self.tool.get_email_threads(client, **params)
-            else:
-                logger.error(f"❌ Unknown Gmail action: {action}")
+            method = self._DISPATCH.get(action)
+            if method is None:
+                logger.error("❌ Unknown Gmail action: %s", action)
                 raise ValueError(f"Unknown Gmail action: {action}")
             
-            logger.info(f"✅ Gmail tool method completed: {action.value}")
+            logger.debug("📧 Calling %s method", method.__name__)
+            result = method(self.tool, client, **_filter_kwargs(method, params))
+            
+            logger.debug("✅ Gmail tool method completed: %s", action.value)
             return result
             
-        except TypeError as e:
-            if "unexpected keyword argument" in str(e):
-                logger.error(f"❌ Parameter mismatch for {action.value}: {str(e)}")
-                logger.error(f"📋 Attempted parameters: {list(params.keys())}")
-                
-                # Try to call with minimal required parameters
-                logger.info("🔄 Attempting fallback with minimal parameters")
-                try:
-                    if action == ActionType.READ_EMAILS:
-                        # Only use supported parameters
-                        minimal_params = {k: v for k, v in params.items() if k in ['max_results', 'query', 'include_attachments']}
-                        logger.info(f"🔄 Fallback parameters: {list(minimal_params.keys())}")
-                        result = self.tool.read_recent_emails(client, **minimal_params)
-                        logger.info("✅ Fallback successful")
-                        return result
-                    else:
-                        raise e
-                except Exception as fallback_error:
-                    logger.error(f"❌ Fallback also failed: {str(fallback_error)}")
-                    raise e
-            else:
-                raise e
+        except (HttpError, RefreshError):
+            # Expected API failures - execute() logs and classifies them
+            raise
+            
         except Exception as e:
-            logger.error(f"❌ Error calling Gmail tool method: {str(e)}")
-            logger.error(traceback.format_exc())
+            logger.exception("❌ Error calling Gmail tool method: %s", e)
             raise
 
 class CalendarNode(ExecutionNode):
     """Calendar tool execution node with parameter mapping"""
     
+    DISPLAY_NAME = 'Calendar'
+    SERVICE_NAME = 'calendar'
+    SERVICE_VERSION = 'v3'
+    
+    # Unbound CalendarTool method for each supported action
+    _DISPATCH = {
+        ActionType.CREATE_EVENT: CalendarTool.create_event,
+        ActionType.LIST_EVENTS: CalendarTool.list_events,
+        ActionType.UPDATE_EVENT: CalendarTool.update_event,
+        ActionType.DELETE_EVENT: CalendarTool.delete_event,
+        ActionType.GET_EVENT: CalendarTool.get_meet_link_from_event
+    }
+    
     def __init__(self, auth_manager):
         super().__init__(auth_manager)
         logger.info("📅 Creating CalendarTool instance")
         self.tool = CalendarTool()
         logger.info("✅ CalendarNode initialized successfully")
     
-    def execute(self, step_index: int, tool: ToolType, action: ActionType, 
-                context: Dict[str, Any]) -> StepResult:
-        
-        logger.info(f"📅 Executing Calendar step {step_index}: {action.value}")
-        
-        try:
-            # Get authenticated client
-            logger.info(f"🔐 Getting authenticated Calendar client for user: {context.get('user_id', 'unknown')}")
-            client = self.auth_manager.get_authenticated_client('calendar', 'v3', context['user_id'])
-            
-            if not client:
-                logger.error("❌ Calendar authentication failed - no client returned")
-                raise Exception("Calendar authentication failed")
-            
-            logger.info("✅ Calendar client authenticated successfully")
-            
-            # Prepare and map parameters
-            logger.info("⚙️ Preparing and mapping parameters for Calendar action")
-            params = self._prepare_parameters(action, context)
-            logger.info(f"✅ Parameters prepared and mapped: {list(params.keys())}")
-            
-            # Execute action
-            logger.info(f"🚀 Executing Calendar action: {action.value}")
-            result = self._call_tool_method(action, client, params)
-            logger.info(f"✅ Calendar action completed: {result.get('success', False)}")
-            
-            if result.get('success'):
-                logger.info("✅ Calendar step completed successfully")
-                if 'data' in result:
-                    logger.info(f"📊 Result data keys: {list(result['data'].keys()) if isinstance(result['data'], dict) else 'non-dict data'}")
-            else:
-                logger.error(f"❌ Calendar step failed: {result.get('error', 'Unknown error')}")
-            
-            # ✅ FIXED: Return StepResult as TypedDict
-            return {
-                "step_index": step_index,
-                "tool": tool,
-                "action": action,
-                "status": "completed" if result.get("success") else "failed",
-                "raw_output": result,
-                "extracted_data": {},
-                "error_message": result.get("error") if not result.get("success") else None
-            }
-            
-        except Exception as e:
-            logger.error(f"❌ Exception in Calendar step {step_index}: {str(e)}")
-            logger.error(traceback.format_exc())
-            
-            # ✅ FIXED: Return failed StepResult as TypedDict
-            return {
-                "step_index": step_index,
-                "tool": tool,
-                "action": action,
-                "status": "failed",
-                "raw_output": {},
-                "extracted_data": {},
-                "error_message": str(e)
-            }
-    
     def _prepare_parameters(self, action: ActionType, context: Dict[str, Any]) -> Dict[str, Any]:
         """Prepare parameters for calendar tool with parameter mapping"""
         
-        logger.info(f"⚙️ Preparing Calendar parameters for action: {action.value}")
+        debug = logger.isEnabledFor(logging.DEBUG)
+        logger.debug("⚙️ Preparing Calendar parameters for action: %s", action.value)
         
+        base_params = context.get("step_parameters", {})
         try:
-            base_params = context.get("step_parameters", {})
             shared_context = context.get("shared_context", {})
             
-            logger.info(f"📋 Base parameters before mapping: {list(base_params.keys())}")
-            logger.info(f"📊 Shared context keys: {list(shared_context.keys())}")
+            # Nothing to map and nothing to resolve from earlier steps
+            if not base_params and not shared_context:
+                return {}
+            
+            if debug:
+                logger.debug("📋 Base parameters before mapping: %s", list(base_params.keys()))
+                logger.debug("📊 Shared context keys: %s", list(shared_context.keys()))
             
             # Apply parameter mapping first
-            logger.info("🔄 Applying parameter mapping")
+            logger.debug("🔄 Applying parameter mapping")
             mapped_params = self.parameter_mapper.map_calendar_params(base_params)
-            logger.info(f"✅ Parameters after mapping: {list(mapped_params.keys())}")
+            if debug:
+                logger.debug("✅ Parameters after mapping: %s", list(mapped_params.keys()))
             
             # Smart parameter resolution
             if action == ActionType.CREATE_EVENT:
-                logger.info(f"📅 Processing {action.value} parameters")
+                logger.debug("📅 Processing %s parameters", action.value)
                 
                 # Use attendees from previous steps
                 if "attendees" not in mapped_params and "meeting_attendees" in shared_context:
                     mapped_params["attendees"] = shared_context["meeting_attendees"]
-                    logger.info(f"✅ Added attendees from shared context: {len(mapped_params['attendees']) if isinstance(mapped_params['attendees'], list) else 1}")
+                    if debug:
+                        logger.debug("✅ Added attendees from shared context: %s", _count(mapped_params['attendees']))
                 
                 # Use meeting details from context
-                if "meeting_details" in shared_context:
-                    meeting = shared_context["meeting_details"]
-                    logger.info("🔄 Processing meeting details")
+                meeting = shared_context.get("meeting_details")
+                if meeting is not None:
+                    logger.debug("🔄 Processing meeting details")
                     
                     if "title" not in mapped_params:
                         mapped_params["title"] = meeting.get("title", "Meeting")
-                        logger.info(f"📝 Added title from context: {mapped_params['title']}")
+                        logger.debug("📝 Added title from context: %s", mapped_params['title'])
                         
                     if "description" not in mapped_params:
                         mapped_params["description"] = meeting.get("description", "")
-                        logger.info(f"📝 Added description from context: {len(mapped_params['description'])} chars")
+                        if debug:
+                            logger.debug("📝 Added description from context: %s chars", len(mapped_params['description']))
                 
                 # Handle include_meet parameter for Google Meet integration
-                if mapped_params.get("include_meet", False):
+                if debug and mapped_params.get("include_meet", False):
                     # This will be handled by the calendar tool to decide between create_event or create_meet_event
-                    logger.info("🎥 Google Meet requested for event")
+                    logger.debug("🎥 Google Meet requested for event")
             
-            logger.info(f"✅ Calendar parameters fully prepared: {list(mapped_params.keys())}")
+            if debug:
+                logger.debug("✅ Calendar parameters fully prepared: %s", list(mapped_params.keys()))
             return mapped_params
             
         except Exception as e:
-            logger.error(f"❌ Error preparing Calendar parameters: {str(e)}")
-            logger.error(traceback.format_exc())
-            return context.get("step_parameters", {})
+            logger.exception("❌ Error preparing Calendar parameters: %s", e)
+            # Copy so the tool call can't mutate the plan's own parameter dict
+            return dict(base_params)
     
     def _call_tool_method(self, action: ActionType, client, params: Dict[str, Any]):
         """Call appropriate calendar tool method with logging"""
         
-        logger.info(f"🔧 Calling Calendar tool method for action: {action.value}")
-        logger.info(f"📋 Final parameters: {list(params.keys())}")
+        logger.debug("🔧 Calling Calendar tool method for action: %s", action.value)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("📋 Final parameters: %s", list(params.keys()))
         
         try:
-            if action == ActionType.CREATE_EVENT:
-                logger.info("📅 Calling create_event method")
-                # Check if Google Meet is requested
-                if params.get("include_meet", False):
-                    # Remove include_meet from params before calling tool
-                    params_copy = params.copy()
-                    params_copy.pop("include_meet", None)
-                    logger.info("🎥 Calling create_meet_event method")
-                    result = self.tool.create_meet_event(client, **params_copy)
-                else:
-                    result = self.tool.create_event(client, **params)
-            elif action == ActionType.LIST_EVENTS:
-                logger.info("📋 Calling list_events method")
-                result = self.tool.list_events(client, **params)
-            elif action == ActionType.UPDATE_EVENT:
-                logger.info("✏️ Calling update_event method")
-                result = self.tool.update_event(client, **params)
-            elif action == ActionType.DELETE_EVENT:
-                logger.info("🗑️ Calling delete_event method")
-                result = self.tool.delete_event(client, **params)
-            elif action == ActionType.GET_EVENT:
-                logger.info("🔗 Calling get_meet_link_from_event method")
-                result = self.tool.get_meet_link_from_event(client, **params)
+            # Check if Google Meet is requested
+            if action == ActionType.CREATE_EVENT and params.get("include_meet", False):
+                # Remove include_meet from params before calling tool
+                params = params.copy()
+                params.pop("include_meet", None)
+                method = CalendarTool.create_meet_event
             else:
-                logger.error(f"❌ Unknown Calendar action: {action}")
-                raise ValueError(f"Unknown Calendar action: {action}")
+                method = self._DISPATCH.get(action)
+                if method is None:
+                    logger.error("❌ Unknown Calendar action: %s", action)
+                    raise ValueError(f"Unknown Calendar action: {action}")
+            
+            logger.debug("📅 Calling %s method", method.__name__)
+            result = method(self.tool, client, **_filter_kwargs(method, params))
             
-            logger.info(f"✅ Calendar tool method completed: {action.value}")
+            logger.debug("✅ Calendar tool method completed: %s", action.value)
             return result
             
+        except (HttpError, RefreshError):
+            # Expected API failures - execute() logs and classifies them
+            raise
+            
         except Exception as e:
-            logger.error(f"❌ Error calling Calendar tool method: {str(e)}")
-            logger.error(traceback.format_exc())
+            logger.exception("❌ Error calling Calendar tool method: %s", e)
             raise
 
 class DriveNode(ExecutionNode):
     """Drive tool execution node with parameter mapping"""
     
+    DISPLAY_NAME = 'Drive'
+    SERVICE_NAME = 'drive'
+    SERVICE_VERSION = 'v3'
+    
+    # Unbound DriveTool method for each supported action
+    _DISPATCH = {
+        ActionType.UPLOAD_FILE: DriveTool.upload_file,
+        ActionType.SEARCH_FILES: DriveTool.search_files,
+        ActionType.DOWNLOAD_FILE: DriveTool.download_file,
+        ActionType.SHARE_FILE: DriveTool.share_file,
+        ActionType.LIST_FILES: DriveTool.list_recent_files
+    }
+    
     def __init__(self, auth_manager):
         super().__init__(auth_manager)
         logger.info("📁 Creating DriveTool instance")
         self.tool = DriveTool()
         logger.info("✅ DriveNode initialized successfully")
     
-    def execute(self, step_index: int, tool: ToolType, action: ActionType, 
-                context: Dict[str, Any]) -> StepResult:
-        
-        logger.info(f"📁 Executing Drive step {step_index}: {action.value}")
-        
-        try:
-            # Get authenticated client
-            logger.info(f"🔐 Getting authenticated Drive client for user: {context.get('user_id', 'unknown')}")
-            client = self.auth_manager.get_authenticated_client('drive', 'v3', context['user_id'])
-            
-            if not client:
-                logger.error("❌ Drive authentication failed - no client returned")
-                raise Exception("Drive authentication failed")
-            
-            logger.info("✅ Drive client authenticated successfully")
-            
-            # Prepare and map parameters
-            logger.info("⚙️ Preparing and mapping parameters for Drive action")
-            params = self._prepare_parameters(action, context)
-            logger.info(f"✅ Parameters prepared and mapped: {list(params.keys())}")
-            
-            # Execute action
-            logger.info(f"🚀 Executing Drive action: {action.value}")
-            result = self._call_tool_method(action, client, params)
-            logger.info(f"✅ Drive action completed: {result.get('success', False)}")
-            
-            if result.get('success'):
-                logger.info("✅ Drive step completed successfully")
-                if 'data' in result:
-                    logger.info(f"📊 Result data keys: {list(result['data'].keys()) if isinstance(result['data'], dict) else 'non-dict data'}")
-            else:
-                logger.error(f"❌ Drive step failed: {result.get('error', 'Unknown error')}")
-            
-            # ✅ FIXED: Return StepResult as TypedDict
-            return {
-                "step_index": step_index,
-                "tool": tool,
-                "action": action,
-                "status": "completed" if result.get("success") else "failed",
-                "raw_output": result,
-                "extracted_data": {},
-                "error_message": result.get("error") if not result.get("success") else None
-            }
-            
-        except Exception as e:
-            logger.error(f"❌ Exception in Drive step {step_index}: {str(e)}")
-            logger.error(traceback.format_exc())
-            
-            # ✅ FIXED: Return failed StepResult as TypedDict
-            return {
-                "step_index": step_index,
-                "tool": tool,
-                "action": action,
-                "status": "failed",
-                "raw_output": {},
-                "extracted_data": {},
-                "error_message": str(e)
-            }
-    
     def _prepare_parameters(self, action: ActionType, context: Dict[str, Any]) -> Dict[str, Any]:
         """Prepare parameters for drive tool with parameter mapping"""
         
-        logger.info(f"⚙️ Preparing Drive parameters for action: {action.value}")
+        debug = logger.isEnabledFor(logging.DEBUG)
+        logger.debug("⚙️ Preparing Drive parameters for action: %s", action.value)
         
+        base_params = context.get("step_parameters", {})
         try:
-            base_params = context.get("step_parameters", {})
             shared_context = context.get("shared_context", {})
             
-            logger.info(f"📋 Base parameters before mapping: {list(base_params.keys())}")
-            logger.info(f"📊 Shared context keys: {list(shared_context.keys())}")
+            # Nothing to map and nothing to resolve from earlier steps
+            if not base_params and not shared_context:
+                return {}
+            
+            if debug:
+                logger.debug("📋 Base parameters before mapping: %s", list(base_params.keys()))
+                logger.debug("📊 Shared context keys: %s", list(shared_context.keys()))
             
             # Apply parameter mapping first
-            logger.info("🔄 Applying parameter mapping")
+            logger.debug("🔄 Applying parameter mapping")
             mapped_params = self.parameter_mapper.map_drive_params(base_params)
-            logger.info(f"✅ Parameters after mapping: {list(mapped_params.keys())}")
+            if debug:
+                logger.debug("✅ Parameters after mapping: %s", list(mapped_params.keys()))
             
             # Smart parameter resolution
             if action == ActionType.SHARE_FILE:
-                logger.info("📁 Processing SHARE_FILE parameters")
+                logger.debug("📁 Processing SHARE_FILE parameters")
                 
                 # Use attendees from shared context for sharing
                 if "email_addresses" not in mapped_params and "meeting_attendees" in shared_context:
                     mapped_params["email_addresses"] = shared_context["meeting_attendees"]
-                    logger.info(f"✅ Added share recipients from shared context: {len(mapped_params['email_addresses']) if isinstance(mapped_params['email_addresses'], list) else 1}")
+                    if debug:
+                        logger.debug("✅ Added share recipients from shared context: %s", _count(mapped_params['email_addresses']))
             
             elif action == ActionType.LIST_FILES:
-                logger.info("📁 Processing LIST_FILES parameters")
+                logger.debug("📁 Processing LIST_FILES parameters")
                 
                 # Handle recent parameter for backwards compatibility
-                if mapped_params.get("recent", True):
+                if debug and mapped_params.get("recent", True):
                     # This will be used to determine sorting and filtering in the tool
-                    logger.info("📅 Recent files requested")
+                    logger.debug("📅 Recent files requested")
             
-            logger.info(f"✅ Drive parameters fully prepared: {list(mapped_params.keys())}")
+            if debug:
+                logger.debug("✅ Drive parameters fully prepared: %s", list(mapped_params.keys()))
             return mapped_params
             
         except Exception as e:
-            logger.error(f"❌ Error preparing Drive parameters: {str(e)}")
-            logger.error(traceback.format_exc())
-            return context.get("step_parameters", {})
+            logger.exception("❌ Error preparing Drive parameters: %s", e)
+            # Copy so the tool call can't mutate the plan's own parameter dict
+            return dict(base_params)
     
     def _call_tool_method(self, action: ActionType, client, params: Dict[str, Any]):
         """Call appropriate drive tool method with logging"""
         
-        logger.info(f"🔧 Calling Drive tool method for action: {action.value}")
-        logger.info(f"📋 Final parameters: {list(params.keys())}")
+        logger.debug("🔧 Calling Drive tool method for action: %s", action.value)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("📋 Final parameters: %s", list(params.keys()))
         
         try:
-            if action == ActionType.UPLOAD_FILE:
-                logger.info("📤 Calling upload_file method")
-                result = self.tool.upload_file(client, **params)
-            elif action == ActionType.SEARCH_FILES:
-                logger.info("🔍 Calling search_files method")
-                result = self.tool.search_files(client, **params)
-            elif action == ActionType.DOWNLOAD_FILE:
-                logger.info("📥 Calling download_file method")
-                result = self.tool.download_file(client, **params)
-            elif action == ActionType.SHARE_FILE:
-                logger.info("🔗 Calling share_file method")
-                result = self.tool.share_file(client, **params)
-            elif action == ActionType.LIST_FILES:
-                logger.info("📋 Calling list_recent_files method")
-                result = self.tool.list_recent_files(client, **params)
-            else:
-                logger.error(f"❌ Unknown Drive action: {action}")
+            method = self._DISPATCH.get(action)
+            if method is None:
+                logger.error("❌ Unknown Drive action: %s", action)
                 raise ValueError(f"Unknown Drive action: {action}")
             
-            logger.info(f"✅ Drive tool method completed: {action.value}")
+            logger.debug("📁 Calling %s method", method.__name__)
+            result = method(self.tool, client, **_filter_kwargs(method, params))
+            
+            logger.debug("✅ Drive tool method completed: %s", action.value)
             return result
             
+        except (HttpError, RefreshError):
+            # Expected API failures - execute() logs and classifies them
+            raise
+            
         except Exception as e:
-            logger.error(f"❌ Error calling Drive tool method: {str(e)}")
-            logger.error(traceback.format_exc())
+            logger.exception("❌ Error calling Drive tool method: %s", e)
             raise
 
+class UnsupportedStepNode:
+    """Node for a step no tool can run - only that step fails, when it executes, not the whole plan"""
+    
+    def __init__(self, error_message: str):
+        self.error_message = error_message
+    
+    def execute(self, step_index: int, tool: ToolType, action: ActionType,
+                context: Dict[str, Any], client=None) -> StepResult:
+        logger.error("❌ Step %s cannot run: %s", step_index, self.error_message)
+        return failed_step_result(step_index, tool, action, self.error_message)
+
 class NodeFactory:
     """Factory for creating execution nodes with parameter mapping"""
     
+    __slots__ = ('auth_manager', '_nodes')
+    
+    # Process-wide factories, one per auth manager, shared by every GraphBuilder using that manager.
+    # A factory's nodes are never rebound - graphs from other sessions may be running them.
+    _MAX_INSTANCES = 32
+    _instances: "OrderedDict[Any, NodeFactory]" = OrderedDict()
+    _instance_lock = threading.Lock()
+    
+    @classmethod
+    def instance(cls, auth_manager) -> "NodeFactory":
+        """Return the shared factory for an auth manager, creating it on first use"""
+        
+        with cls._instance_lock:
+            factory = cls._instances.get(auth_manager)
+            if factory is None:
+                factory = cls._instances[auth_manager] = cls(auth_manager)
+                # Evicted factories stay valid for the builders still holding them
+                if len(cls._instances) > cls._MAX_INSTANCES:
+                    cls._instances.popitem(last=False)
+            else:
+                cls._instances.move_to_end(auth_manager)
+            return factory
+    
     def __init__(self, auth_manager):
         logger.info("🏭 Initializing NodeFactory with parameter mapping")
         
@@ -559,27 +617,49 @@ class NodeFactory:
                 ToolType.DRIVE: DriveNode(auth_manager)
             }
             
-            logger.info(f"✅ NodeFactory initialized with {len(self._nodes)} nodes: {list(self._nodes.keys())}")
+            logger.info("✅ NodeFactory initialized with %s nodes: %s", len(self._nodes), list(self._nodes.keys()))
             
         except Exception as e:
-            logger.error(f"❌ Failed to initialize NodeFactory: {str(e)}")
-            logger.error(traceback.format_exc())
+            logger.exception("❌ Failed to initialize NodeFactory: %s", e)
             raise
     
-    def get_node(self, tool_type: ToolType) -> ExecutionNode:
-        """Get execution node for tool type with logging"""
+    def prewarm(self, user_id: str, steps: List[ExecutionStep]) -> Dict[int, Any]:
+        """Build a Google client for each step on the calling thread, keyed by step index"""
         
-        logger.info(f"🔧 Getting execution node for tool: {tool_type.value}")
+        # Steps run on LangGraph worker threads, which can't see the Streamlit session holding the
+        # user's tokens - every auth check there fails. Checking here also refreshes an expiring
+        # token once instead of in every parallel step.
+        if not self.auth_manager.is_authenticated(user_id):
+            logger.warning("⚠️ User %s is not authenticated - Google steps will fail", user_id)
+            return {}
         
-        try:
-            node = self._nodes[tool_type]
-            logger.info(f"✅ Node retrieved: {type(node).__name__}")
-            return node
-            
-        except KeyError:
-            logger.error(f"❌ Unknown tool type: {tool_type}")
+        # One client per step - httplib2 connections aren't thread-safe and sibling steps run at once
+        clients = {}
+        for step in steps:
+            node = self._nodes.get(step['tool'])
+            if node is not None:
+                clients[step['step_index']] = self.auth_manager.get_authenticated_client(
+                    node.SERVICE_NAME, node.SERVICE_VERSION, user_id
+                )
+        return clients
+    
+    def resolve(self, tool_type: ToolType, action: ActionType) -> Union[ExecutionNode, "UnsupportedStepNode"]:
+        """Look up a step's node once at graph-build time - a step no node can run gets one that fails it"""
+        
+        node = self._nodes.get(tool_type)
+        if node is None:
+            logger.error("❌ Unknown tool type: %s", tool_type)
+            return UnsupportedStepNode(f"Unknown tool type: {tool_type}")
+        if action not in node._DISPATCH:
+            logger.error("❌ %s does not support action: %s", tool_type.value, action.value)
+            return UnsupportedStepNode(f"Unsupported action {action.value} for tool {tool_type.value}")
+        return node
+    
+    def get_node(self, tool_type: ToolType) -> ExecutionNode:
+        """Get execution node for tool type"""
+        
+        node = self._nodes.get(tool_type)
+        if node is None:
+            logger.error("❌ Unknown tool type: %s", tool_type)
             raise ValueError(f"Unknown tool type: {tool_type}")
-        except Exception as e:
-            logger.error(f"❌ Error getting node: {str(e)}")
-            logger.error(traceback.format_exc())
-            raise
\ No newline at end of file
+        return node
\ No newline at end of file
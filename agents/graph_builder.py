@@ -1,15 +1,79 @@
+import functools
 import logging
-import traceback
-from typing import Dict, Any, List
+import threading
+import time
+from collections import OrderedDict
+from typing import Annotated, Dict, Any, Callable, Iterator, Optional, Tuple, get_origin, get_type_hints
+from langchain_core.runnables import RunnableConfig
 from langgraph.graph import StateGraph, END, START
 from langgraph.checkpoint.memory import MemorySaver
-from agents.plan_schema import ExecutionPlan, WorkflowState
-from agents.execution_nodes import NodeFactory
-from agents.data_extractor import DataExtractor
+from agents.plan_schema import (
+    ActionType, ExecutionPlan, ExecutionStep, ToolType, WorkflowState, failed_step_result, plan_levels
+)
+from agents.execution_nodes import ExecutionNode, NodeFactory
+from agents.data_extractor import DataExtractor, get_extractor
+from config import settings
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# LRU of compiled graphs keyed by plan shape - step nodes read their step from state,
+# so one compiled graph serves every plan with the same tools, actions and dependencies
+_GRAPH_CACHE_MAX_ENTRIES = 64
+_compiled_graphs: "OrderedDict[Tuple, Any]" = OrderedDict()
+_compiled_graphs_lock = threading.Lock()
+
+# Upper bound on the wait before re-running a step that hit a transient API error
+_MAX_RETRY_DELAY = 30.0
+
+# Join node every terminal step leads into
+_FINISH_NODE = "finish"
+
+# Config key for the per-step Google clients built on the caller's thread
+_GOOGLE_CLIENTS_KEY = "google_clients"
+
+def _plan_signature(plan: ExecutionPlan) -> Tuple:
+    """Structural key of a plan - the index, tool, action and dependencies of every step, in order"""
+    return tuple(
+        (step['step_index'], step['tool'], step['action'], tuple(step['dependencies']))
+        for step in plan['steps']
+    )
+
+# Reducers declared on WorkflowState (Annotated[type, reducer]) - other keys in a node's update replace the old value
+_STATE_REDUCERS = {
+    key: hint.__metadata__[-1]
+    for key, hint in get_type_hints(WorkflowState, include_extras=True).items()
+    if get_origin(hint) is Annotated
+}
+
+class _SingleStepGraph:
+    """Runs a one-step plan's nodes directly, with the same stream() contract as a compiled graph"""
+    
+    def __init__(self, step_node: Callable[..., Dict[str, Any]]):
+        self._step_node = step_node
+        self._final_state: Optional[WorkflowState] = None
+    
+    def stream(self, input_state: Optional[WorkflowState], config: Optional[Dict[str, Any]] = None,
+               stream_mode: str = "values") -> Iterator[WorkflowState]:
+        """Yield the input state, then the state after each node's updates are merged"""
+        
+        # Resume request - there is no partial progress to pick up, only the finished state
+        if input_state is None:
+            if self._final_state is not None:
+                yield self._final_state
+            return
+        
+        yield input_state
+        
+        state = dict(input_state)
+        for node in (functools.partial(self._step_node, config=config), GraphBuilder._finish_workflow):
+            for key, value in node(state).items():
+                reducer = _STATE_REDUCERS.get(key)
+                state[key] = reducer(state.get(key), value) if reducer else value
+            
+            self._final_state = dict(state)
+            yield self._final_state
+
 class GraphBuilder:
     """Builds dynamic LangGraph workflows with proper checkpointing and persistence"""
     
@@ -18,19 +82,18 @@ class GraphBuilder:
         
         try:
             self.auth_manager = auth_manager
-            logger.info("🔧 Creating NodeFactory")
-            self.node_factory = NodeFactory(auth_manager)
-            logger.info("✅ NodeFactory created successfully")
+            logger.info("🔧 Getting shared NodeFactory")
+            self.node_factory = NodeFactory.instance(auth_manager)
+            logger.info("✅ NodeFactory ready")
             
-            logger.info("🤖 Creating DataExtractor")
-            self.data_extractor = DataExtractor()
-            logger.info("✅ DataExtractor created successfully")
+            logger.info("🤖 Getting shared DataExtractor")
+            self.data_extractor = get_extractor()
+            logger.info("✅ DataExtractor ready")
             
             logger.info("✅ GraphBuilder initialization complete")
             
         except Exception as e:
-            logger.error(f"❌ Failed to initialize GraphBuilder: {str(e)}")
-            logger.error(traceback.format_exc())
+            logger.exception("❌ Failed to initialize GraphBuilder: %s", e)
             raise
     
     def _get_checkpointer(self):
@@ -41,9 +104,39 @@ class GraphBuilder:
     def build_graph(self, plan: ExecutionPlan, user_id: str) -> StateGraph:
         """Build executable LangGraph with proper checkpointing and persistence"""
         
-        logger.info(f"🚀 Building graph for plan: {plan['intent']}")
-        logger.info(f"👤 User ID: {user_id}")
-        logger.info(f"📋 Plan has {len(plan['steps'])} steps")
+        logger.info("🚀 Building graph for plan: %s", plan['intent'])
+        logger.info("👤 User ID: %s", user_id)
+        logger.info("📋 Plan has %s steps", len(plan['steps']))
+        
+        # One step has nothing to schedule or merge in parallel - skip the Pregel loop and checkpointing
+        if len(plan['steps']) == 1 and not plan['steps'][0]['dependencies']:
+            logger.info("⚡ Single-step plan - running its node without a graph")
+            return _SingleStepGraph(self._create_step_node(plan['steps'][0], 0))
+        
+        signature = _plan_signature(plan)
+        with _compiled_graphs_lock:
+            cached_graph = _compiled_graphs.get(signature)
+            if cached_graph is not None:
+                _compiled_graphs.move_to_end(signature)
+        
+        if cached_graph is not None:
+            logger.info("♻️ Reusing compiled graph for this plan shape")
+        else:
+            cached_graph = self._compile_workflow(plan, signature)
+        
+        # ✅ FIXED: Attach a fresh checkpointer per run for persistence and recovery - the cached
+        # graph holds none, so it never keeps a finished run's tool payloads alive
+        logger.info("💾 Attaching checkpointer to compiled graph")
+        return cached_graph.copy(update={"checkpointer": self._get_checkpointer()})
+    
+    def client_config(self, plan: ExecutionPlan, user_id: str) -> Dict[str, Any]:
+        """Configurable entries carrying each step's Google client - call on the thread that owns the session"""
+        
+        # Steps run on LangGraph worker threads, which can't authenticate, so their clients are built here
+        return {_GOOGLE_CLIENTS_KEY: self.node_factory.prewarm(user_id, plan['steps'])}
+    
+    def _compile_workflow(self, plan: ExecutionPlan, signature: Tuple) -> StateGraph:
+        """Compile the plan's workflow without a checkpointer and cache it under the plan signature"""
         
         try:
             # ✅ FIXED: Create graph with WorkflowState (now TypedDict)
@@ -51,207 +144,238 @@ class GraphBuilder:
             workflow = StateGraph(WorkflowState)
             logger.info("✅ StateGraph created")
             
+            # Reject dangling dependencies and cycles once, up front, instead of failing at compile or run time
+            levels = plan_levels(plan['steps'])
+            logger.info("📐 Plan validated: %s dependency levels", len(levels))
+            
+            # Node names are reused by every edge pass - build each one once
+            node_names = {step['step_index']: f"step_{step['step_index']}" for step in plan['steps']}
+            
             # Add nodes for each step
             logger.info("🔗 Adding nodes for each step")
-            for step in plan['steps']:
-                node_name = f"step_{step['step_index']}"
-                logger.info(f"➕ Adding node: {node_name} ({step['tool'].value} - {step['action'].value})")
+            for position, step in enumerate(plan['steps']):
+                node_name = node_names[step['step_index']]
+                logger.debug("➕ Adding node: %s (%s - %s)", node_name, step['tool'].value, step['action'].value)
                 
                 # Create node function that returns proper state updates
-                node_func = self._create_step_node(step)
+                node_func = self._create_step_node(step, position)
                 workflow.add_node(node_name, node_func)
-                logger.info(f"✅ Node {node_name} added successfully")
+                logger.debug("✅ Node %s added successfully", node_name)
             
             # Add edges based on dependencies
             logger.info("🔗 Setting up workflow edges with proper dependency handling")
-            self._add_workflow_edges(workflow, plan)
+            self._add_workflow_edges(workflow, plan, node_names)
             
-            # ✅ FIXED: Compile with checkpointer for persistence and recovery
-            logger.info("🔧 Compiling workflow graph with checkpointer")
-            checkpointer = self._get_checkpointer()
-            compiled_graph = workflow.compile(checkpointer=checkpointer)
-            logger.info("✅ Workflow graph compiled successfully with persistence")
+            logger.info("🔧 Compiling workflow graph")
+            compiled_graph = workflow.compile()
+            logger.info("✅ Workflow graph compiled successfully")
+            
+            with _compiled_graphs_lock:
+                _compiled_graphs[signature] = compiled_graph
+                if len(_compiled_graphs) > _GRAPH_CACHE_MAX_ENTRIES:
+                    _compiled_graphs.popitem(last=False)
             
             return compiled_graph
             
         except Exception as e:
-            logger.error(f"❌ Error building graph: {str(e)}")
-            logger.error(traceback.format_exc())
+            logger.exception("❌ Error building graph: %s", e)
             raise
     
-    def _add_workflow_edges(self, workflow: StateGraph, plan: ExecutionPlan):
+    def _add_workflow_edges(self, workflow: StateGraph, plan: ExecutionPlan, node_names: Dict[int, str]):
         """Add edges based on step dependencies"""
         
         logger.info("🔗 Adding edges based on step dependencies")
         
         try:
-            # Connect steps with no dependencies to START
+            # START and dependency edges in one pass over the (already validated) plan
+            depended_on = set()
             for step in plan['steps']:
-                if not step['dependencies']:
-                    current_node = f"step_{step['step_index']}"
-                    logger.info(f"🚀 Connecting {current_node} to START")
-                    workflow.add_edge(START, current_node)
-            
-            # Add edges FROM dependencies TO dependent steps
-            for step in plan['steps']:
-                current_node = f"step_{step['step_index']}"
+                current_node = node_names[step['step_index']]
+                dependencies = step['dependencies']
                 
-                if step['dependencies']:
-                    logger.info(f"📋 Step {step['step_index']} has dependencies: {step['dependencies']}")
-                    
-                    for dep_step_index in step['dependencies']:
-                        dep_node = f"step_{dep_step_index}"
-                        logger.info(f"➡️ Adding edge: {dep_node} -> {current_node}")
-                        workflow.add_edge(dep_node, current_node)
+                if not dependencies:
+                    logger.debug("🚀 Connecting %s to START", current_node)
+                    workflow.add_edge(START, current_node)
+                else:
+                    logger.debug("📋 Step %s has dependencies: %s", step['step_index'], dependencies)
+                    dep_nodes = [node_names[dep_step_index] for dep_step_index in dependencies]
+                    # One edge from all dependencies waits for every one of them - separate edges
+                    # would start the step as soon as the first dependency finished
+                    workflow.add_edge(dep_nodes if len(dep_nodes) > 1 else dep_nodes[0], current_node)
+                    depended_on.update(dependencies)
             
-            # Connect steps with no dependents to END
-            logger.info("🏁 Adding edges to END for terminal steps")
-            for step in plan['steps']:
-                current_node = f"step_{step['step_index']}"
-                
-                # Check if any other step depends on this one
-                has_dependents = any(
-                    step['step_index'] in other_step['dependencies'] 
-                    for other_step in plan['steps']
-                )
-                
-                if not has_dependents:
-                    logger.info(f"🏁 Adding edge to END: {current_node} -> END")
-                    workflow.add_edge(current_node, END)
+            # Join steps with no dependents in one finish node - parallel branches end in different
+            # supersteps, so only a node waiting for all of them knows the plan is done
+            logger.info("🏁 Joining terminal steps before END")
+            terminal_nodes = [node_names[step['step_index']] for step in plan['steps']
+                              if step['step_index'] not in depended_on]
+            logger.debug("🏁 Adding edge to %s: %s", _FINISH_NODE, terminal_nodes)
+            workflow.add_node(_FINISH_NODE, GraphBuilder._finish_workflow)
+            workflow.add_edge(terminal_nodes if len(terminal_nodes) > 1 else terminal_nodes[0], _FINISH_NODE)
+            workflow.add_edge(_FINISH_NODE, END)
             
             logger.info("✅ All workflow edges configured successfully")
             
         except Exception as e:
-            logger.error(f"❌ Error adding workflow edges: {str(e)}")
-            logger.error(traceback.format_exc())
+            logger.exception("❌ Error adding workflow edges: %s", e)
             raise
     
-    def _create_step_node(self, step):
+    def _create_step_node(self, step, position: int):
         """✅ FIXED: Create node function that returns proper state updates (not full state)"""
         
-        logger.info(f"🔧 Creating step node for step {step['step_index']}: {step['description']}")
+        logger.debug("🔧 Creating step node for step %s: %s", step['step_index'], step['description'])
+        
+        # Fixed per step - bound into the node once so runs read arguments instead of dict items
+        step_index, tool, action = step['step_index'], step['tool'], step['action']
+        
+        # Resolve the execution node once per graph build instead of on every run
+        execution_node = self.node_factory.resolve(tool, action)
+        logger.debug("✅ Execution node resolved: %s", type(execution_node).__name__)
         
-        def step_node(state: WorkflowState) -> Dict[str, Any]:
-            """Execute single step and return state updates only"""
+        logger.debug("✅ Step node created for step %s", step_index)
+        # Everything a run needs is bound up front - no closure over the builder
+        return functools.partial(
+            GraphBuilder._run_step,
+            position=position, step_index=step_index, tool=tool, action=action,
+            execution_node=execution_node, data_extractor=self.data_extractor
+        )
+    
+    @staticmethod
+    def _run_step(state: WorkflowState, config: Optional[RunnableConfig] = None, *, position: int, step_index: int, tool: ToolType, action: ActionType,
+                  execution_node: ExecutionNode, data_extractor: DataExtractor) -> Dict[str, Any]:
+        """Execute single step and return state updates only"""
+        
+        # The compiled graph is shared by plans of the same shape - take this plan's step from state
+        step = state['plan']['steps'][position]
+        
+        logger.info("⚡ Executing step %s: %s", step_index, step['description'])
+        logger.debug("🔧 Tool: %s, Action: %s", tool.value, action.value)
+        
+        try:
+            # Get execution context from current state
+            logger.debug("📊 Getting context for step %s", step_index)
+            context = GraphBuilder._get_context_from_state(state, step)
+            logger.debug("✅ Context retrieved for step %s", step_index)
             
-            logger.info(f"⚡ Executing step {step['step_index']}: {step['description']}")
-            logger.info(f"🔧 Tool: {step['tool'].value}, Action: {step['action'].value}")
+            # Client built for this step on the caller's thread, if there is one
+            client = ((config or {}).get("configurable") or {}).get(_GOOGLE_CLIENTS_KEY, {}).get(step_index)
             
-            try:
-                # Get execution context from current state
-                logger.info(f"📊 Getting context for step {step['step_index']}")
-                context = self._get_context_from_state(state, step['step_index'])
-                logger.info(f"✅ Context retrieved for step {step['step_index']}")
+            # Execute step, re-running it with exponential backoff while the API reports a transient error
+            logger.debug("🚀 Executing step %s", step_index)
+            for attempt in range(settings.STEP_MAX_RETRIES + 1):
+                step_result = execution_node.execute(
+                    step_index, 
+                    tool, 
+                    action, 
+                    context,
+                    client
+                )
+                if step_result['status'] != "retryable" or attempt == settings.STEP_MAX_RETRIES:
+                    break
+                delay = min(max(step_result.get('retry_after', 1.0), 2.0 ** attempt), _MAX_RETRY_DELAY)
+                logger.warning("⏳ Step %s hit a transient error, retrying in %.1fs (attempt %s of %s)",
+                               step_index, delay, attempt + 2, settings.STEP_MAX_RETRIES + 1)
+                time.sleep(delay)
+            
+            if step_result['status'] == "retryable":
+                # Out of retries - the workflow treats it like any other failure
+                step_result['status'] = "failed"
+            logger.info("✅ Step %s execution completed with status: %s", step_index, step_result['status'])
+            
+            # ✅ FIXED: Return only state updates, not full state - LangGraph will merge these
+            if step_result['status'] == "completed":
+                logger.debug("✅ Step %s completed successfully", step_index)
                 
-                # Get appropriate execution node
-                logger.info(f"🔧 Getting execution node for tool: {step['tool'].value}")
-                execution_node = self.node_factory.get_node(step['tool'])
-                logger.info(f"✅ Execution node retrieved: {type(execution_node).__name__}")
+                # Extract data for future steps
+                logger.debug("🔄 Extracting data for future steps from step %s", step_index)
+                remaining_steps = [s for s in state['plan']['steps'] if s['step_index'] > step_index]
                 
-                # Execute step
-                logger.info(f"🚀 Executing step {step['step_index']}")
-                step_result = execution_node.execute(
-                    step['step_index'], 
-                    step['tool'], 
-                    step['action'], 
-                    context
+                extracted_data = data_extractor.extract_data(
+                    step_result, step, remaining_steps, state['shared_context']
                 )
-                logger.info(f"✅ Step {step['step_index']} execution completed with status: {step_result['status']}")
+                logger.debug("✅ Data extraction completed for step %s", step_index)
                 
-                # ✅ FIXED: Return only state updates, not full state - LangGraph will merge these
-                if step_result['status'] == "completed":
-                    logger.info(f"✅ Step {step['step_index']} completed successfully")
-                    
-                    # Extract data for future steps
-                    logger.info(f"🔄 Extracting data for future steps from step {step['step_index']}")
-                    remaining_steps = [s for s in state['plan']['steps'] if s['step_index'] > step['step_index']]
-                    
-                    extracted_data = self.data_extractor.extract_data(
-                        step_result, step, remaining_steps, state['shared_context']
-                    )
-                    logger.info(f"✅ Data extraction completed for step {step['step_index']}")
-                    
-                    # Update extracted data in step result
-                    step_result['extracted_data'] = extracted_data.get("extracted_data", {})
-                    
-                    # Calculate next step and status
-                    next_step = state['current_step'] + 1
-                    total_steps = len(state['plan']['steps'])
-                    new_status = "completed" if next_step > total_steps else "executing"
-                    
-                    # ✅ RETURN STATE UPDATES ONLY - LangGraph reducers will merge these automatically
-                    return {
-                        "step_results": {step_result['step_index']: step_result},
-                        "shared_context": {
-                            **extracted_data.get("context_updates", {}),
-                            **extracted_data.get("for_future_steps", {})
-                        },
-                        "current_step": next_step,
-                        "status": new_status,
-                        "execution_log": [f"✅ Step {step['step_index']} completed: {step['description']}"]
-                    }
-                else:
-                    # Handle failure
-                    logger.error(f"❌ Step {step['step_index']} failed: {step_result.get('error_message')}")
-                    
-                    return {
-                        "step_results": {step_result['step_index']: step_result},
-                        "status": "failed",
-                        "execution_log": [f"❌ Step {step['step_index']} failed: {step_result.get('error_message')}"]
-                    }
+                # Update extracted data in step result
+                step_result['extracted_data'] = extracted_data.get("extracted_data", {})
                 
-            except Exception as e:
-                # Handle unexpected errors
-                logger.error(f"❌ Unexpected error in step {step['step_index']}: {str(e)}")
-                logger.error(traceback.format_exc())
+                # Completion is decided by the finish node once every branch is done
+                next_step = state['current_step'] + 1
                 
-                # Create failed step result
-                failed_result = {
-                    'step_index': step['step_index'],
-                    'tool': step['tool'],
-                    'action': step['action'],
-                    'status': "failed",
-                    'raw_output': {},
-                    'extracted_data': {},
-                    'error_message': str(e)
+                # ✅ RETURN STATE UPDATES ONLY - LangGraph reducers will merge these automatically
+                return {
+                    "step_results": {step_result['step_index']: step_result},
+                    "shared_context": {
+                        **extracted_data.get("context_updates", {}),
+                        **extracted_data.get("for_future_steps", {})
+                    },
+                    "current_step": next_step,
+                    "status": "executing",
+                    "execution_log": [f"✅ Step {step_index} completed: {step['description']}"]
                 }
+            else:
+                # Handle failure
+                logger.error("❌ Step %s failed: %s", step_index, step_result.get('error_message'))
                 
                 return {
-                    "step_results": {step['step_index']: failed_result},
+                    "step_results": {step_result['step_index']: step_result},
                     "status": "failed",
-                    "execution_log": [f"❌ Step {step['step_index']} exception: {str(e)}"]
+                    "execution_log": [f"❌ Step {step_index} failed: {step_result.get('error_message')}"]
                 }
+            
+        except Exception as e:
+            # Handle unexpected errors
+            logger.exception("❌ Unexpected error in step %s: %s", step_index, e)
+            
+            # Create failed step result
+            failed_result = failed_step_result(step_index, tool, action, str(e))
+            
+            return {
+                "step_results": {step_index: failed_result},
+                "status": "failed",
+                "execution_log": [f"❌ Step {step_index} exception: {str(e)}"]
+            }
+    
+    @staticmethod
+    def _finish_workflow(state: WorkflowState) -> Dict[str, Any]:
+        """Mark the plan completed - a failed step's status outranks this in the status reducer"""
         
-        logger.info(f"✅ Step node created for step {step['step_index']}")
-        return step_node
+        logger.info("🏁 All steps finished")
+        return {
+            "current_step": len(state['plan']['steps']) + 1,
+            "status": "completed"
+        }
     
-    def _get_context_from_state(self, state: WorkflowState, step_index: int) -> Dict[str, Any]:
+    @staticmethod
+    def _get_context_from_state(state: WorkflowState, step: ExecutionStep) -> Dict[str, Any]:
         """Get execution context from current state"""
         
-        logger.info(f"📊 Getting context from state for step {step_index}")
+        step_index = step['step_index']
+        logger.debug("📊 Getting context from state for step %s", step_index)
         
         try:
-            step = state['plan']['steps'][step_index - 1]  # Convert to 0-based index
             context = {
                 "shared_context": state['shared_context'],
                 "step_parameters": step['parameters'],
                 "user_id": state['user_id']
             }
             
+            # Independent steps need nothing from earlier results
+            if not step['dependencies']:
+                return context
+            
             # Add data from dependent steps
             for dep_step_index in step['dependencies']:
                 if dep_step_index in state['step_results']:
                     dep_result = state['step_results'][dep_step_index]
                     context[f"step_{dep_step_index}_data"] = dep_result['extracted_data']
                     context[f"step_{dep_step_index}_raw"] = dep_result['raw_output']
-                    logger.info(f"📋 Added dependency data from step {dep_step_index}")
+                    logger.debug("📋 Added dependency data from step %s", dep_step_index)
             
-            logger.info(f"✅ Context prepared for step {step_index}")
+            logger.debug("✅ Context prepared for step %s", step_index)
             return context
             
         except Exception as e:
-            logger.error(f"❌ Error getting context from state: {str(e)}")
-            logger.error(traceback.format_exc())
+            logger.exception("❌ Error getting context from state: %s", e)
             return {
                 "shared_context": state['shared_context'],
                 "step_parameters": {},
@@ -1,6 +1,6 @@
 import json
 import logging
-import traceback
+import re
 from typing import Dict, Any, List
 from langchain.schema import HumanMessage, SystemMessage
 from langchain_nvidia_ai_endpoints import ChatNVIDIA
@@ -10,6 +10,9 @@ from config import settings
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Words that mark explanation lines before the JSON - one case-insensitive scan per line
+_EXPLANATION_RE = re.compile(r'search|find|using|tool|july|will|emails', re.IGNORECASE)
+
 class LLMPlanner:
     """Converts natural language requests into structured execution plans with date context and strict JSON format"""
     
@@ -37,8 +40,7 @@ class LLMPlanner:
             logger.info("✅ LLMPlanner initialization complete")
             
         except Exception as e:
-            logger.error(f"❌ Failed to initialize LLMPlanner: {str(e)}")
-            logger.error(traceback.format_exc())
+            logger.exception("❌ Failed to initialize LLMPlanner: %s", e)
             raise
     
     def create_plan(self, user_request: str, user_context: Dict[str, Any] = None) -> ExecutionPlan:
@@ -110,8 +112,7 @@ class LLMPlanner:
                 return self._create_fallback_plan(user_request, f"JSON parsing error: {str(e)}")
                 
         except Exception as e:
-            logger.error(f"❌ General error in create_plan: {str(e)}")
-            logger.error(traceback.format_exc())
+            logger.exception("❌ General error in create_plan: %s", e)
             # Fallback plan for errors
             return self._create_fallback_plan(user_request, str(e))
     
@@ -140,7 +141,7 @@ class LLMPlanner:
                     cleaned_lines.append('{')
                     cleaned_lines.append(line)
                 # Skip lines that look like explanations
-                elif any(word in stripped.lower() for word in ['search', 'find', 'using', 'tool', 'july', 'will', 'emails']):
+                elif _EXPLANATION_RE.search(stripped):
                     continue
             else:
                 cleaned_lines.append(line)
@@ -417,8 +418,7 @@ RESPOND WITH ONLY THE JSON OBJECT:
             return execution_plan
             
         except Exception as e:
-            logger.error(f"❌ Error parsing plan: {str(e)}")
-            logger.error(traceback.format_exc())
+            logger.exception("❌ Error parsing plan: %s", e)
             raise
     
     def _create_fallback_plan(self, user_request: str, error: str) -> ExecutionPlan:
@@ -451,6 +451,5 @@ RESPOND WITH ONLY THE JSON OBJECT:
             return fallback_plan
             
         except Exception as fallback_error:
-            logger.error(f"❌ Error creating fallback plan: {str(fallback_error)}")
-            logger.error(traceback.format_exc())
+            logger.exception("❌ Error creating fallback plan: %s", fallback_error)
             raise
\ No newline at end of file
@@ -1,5 +1,5 @@
 from typing import List, Dict, Any, Optional, Annotated
-from typing_extensions import TypedDict
+from typing_extensions import NotRequired, TypedDict
 from enum import Enum
 import operator
 
@@ -51,10 +51,46 @@ class StepResult(TypedDict):
     step_index: int
     tool: ToolType
     action: ActionType
-    status: str  # "completed", "failed", "pending"
+    status: str  # "completed", "failed", "retryable", "pending"
     raw_output: Dict[str, Any]
     extracted_data: Dict[str, Any]
     error_message: Optional[str]
+    retry_after: NotRequired[float]  # "retryable" only - seconds to wait before running the step again
+
+def step_result_from_output(step_index: int, tool: ToolType, action: ActionType,
+                            output: Dict[str, Any]) -> StepResult:
+    """Build a StepResult from a tool method's {'success', 'data', 'error', ...} output"""
+    success = output.get("success")
+    return {
+        "step_index": step_index,
+        "tool": tool,
+        "action": action,
+        "status": "completed" if success else "failed",
+        "raw_output": output,
+        "extracted_data": {},
+        "error_message": None if success else output.get("error")
+    }
+
+def failed_step_result(step_index: int, tool: ToolType, action: ActionType,
+                       error_message: str) -> StepResult:
+    """Build a failed StepResult for a step that raised before producing tool output"""
+    return {
+        "step_index": step_index,
+        "tool": tool,
+        "action": action,
+        "status": "failed",
+        "raw_output": {},
+        "extracted_data": {},
+        "error_message": error_message
+    }
+
+def retryable_step_result(step_index: int, tool: ToolType, action: ActionType,
+                          error_message: str, retry_after: float) -> StepResult:
+    """Build a StepResult for a transient failure the step can be re-run after"""
+    result = failed_step_result(step_index, tool, action, error_message)
+    result["status"] = "retryable"
+    result["retry_after"] = retry_after
+    return result
 
 # Custom reducer functions for WorkflowState
 def merge_step_results(existing: Dict[int, StepResult], new: Dict[int, StepResult]) -> Dict[int, StepResult]:
@@ -94,6 +130,29 @@ def merge_shared_context(existing: Dict[str, Any], new: Dict[str, Any]) -> Dict[
     
     return merged
 
+def plan_levels(steps: List[ExecutionStep]) -> List[List[ExecutionStep]]:
+    """Group steps into dependency levels - every step only depends on steps in earlier levels"""
+    by_index = {step['step_index']: step for step in steps}
+    remaining = {step['step_index']: set(step['dependencies']) for step in steps}
+    
+    for step_index, dependencies in remaining.items():
+        unknown = dependencies - by_index.keys()
+        if unknown:
+            raise ValueError(f"Step {step_index} depends on unknown steps: {sorted(unknown)}")
+    
+    levels = []
+    while remaining:
+        ready = sorted(index for index, dependencies in remaining.items() if not dependencies)
+        if not ready:
+            raise ValueError(f"Dependency cycle between steps: {sorted(remaining)}")
+        levels.append([by_index[index] for index in ready])
+        for index in ready:
+            del remaining[index]
+        for dependencies in remaining.values():
+            dependencies.difference_update(ready)
+    
+    return levels
+
 def add_execution_log(existing: List[str], new: List[str]) -> List[str]:
     """Add new log entries to existing log"""
     if not existing:
@@ -102,13 +161,27 @@ def add_execution_log(existing: List[str], new: List[str]) -> List[str]:
         return existing
     return existing + new
 
+def latest_step(existing: int, new: int) -> int:
+    """Keep the furthest step reached - parallel steps reporting together can't move it backwards"""
+    return max(existing or 0, new or 0)
+
+_STATUS_PRECEDENCE = {"executing": 1, "completed": 2, "failed": 3}
+
+def merge_status(existing: str, new: str) -> str:
+    """Merge step statuses - a failure outranks completion, which outranks executing"""
+    if not existing:
+        return new
+    if _STATUS_PRECEDENCE.get(new, 0) >= _STATUS_PRECEDENCE.get(existing, 0):
+        return new
+    return existing
+
 # ✅ KEEP: WorkflowState uses TypedDict with proper reducers
 class WorkflowState(TypedDict):
     plan: ExecutionPlan
     step_results: Annotated[Dict[int, StepResult], merge_step_results]
     shared_context: Annotated[Dict[str, Any], merge_shared_context]
-    current_step: int
-    status: str  # "planning", "executing", "completed", "failed"
+    current_step: Annotated[int, latest_step]
+    status: Annotated[str, merge_status]  # "planning", "executing", "completed", "failed"
     user_id: str
     created_at: str
     # New: Add execution log for better tracking
@@ -22,8 +22,11 @@ def main():
         st.error(f"⚠️ Configuration Error: {str(e)}")
         st.stop()
     
-    # Initialize auth manager (no LLM client needed here)
-    auth_manager = AuthManager()
+    # Initialize auth manager (no LLM client needed here) - one per session, so the
+    # execution nodes built for it are reused across reruns
+    if 'auth_manager' not in st.session_state:
+        st.session_state.auth_manager = AuthManager()
+    auth_manager = st.session_state.auth_manager
     
     # Initialize user session first
     user_id = auth_manager.initialize_user_session()
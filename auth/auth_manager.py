@@ -154,8 +154,9 @@ class AuthManager:
                 scopes=self.scopes
             )
             
-            # Build and return service
-            service = build(service_name, version, credentials=credentials)
+            # Build and return service from the discovery doc bundled with googleapiclient (no network fetch)
+            service = build(service_name, version, credentials=credentials,
+                            static_discovery=True, cache_discovery=False)
             return service
             
         except Exception as e:
@@ -18,6 +18,31 @@ class Settings:
         self.GOOGLE_REDIRECT_URI = os.getenv("GOOGLE_REDIRECT_URI", "http://localhost:8501")
         self.GOOGLE_CREDENTIALS_JSON = os.getenv("GOOGLE_CREDENTIALS_JSON", "credentials.json")
         
+        # Seconds an authenticated Google API client is reused (expired tokens are refreshed on 401)
+        self.GOOGLE_CLIENT_CACHE_TTL = float(os.getenv("GOOGLE_CLIENT_CACHE_TTL", "300"))
+        
+        # Logging - level and format ("text" or "json")
+        self.LOG_LEVEL = os.getenv("LOG_LEVEL", "DEBUG").upper()
+        self.LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+        
+        # Max independent steps the workflow graph runs at once
+        self.STEP_MAX_CONCURRENCY = int(os.getenv("STEP_MAX_CONCURRENCY", "8"))
+        
+        # Times a step is re-run after a transient Google API error (429/5xx)
+        self.STEP_MAX_RETRIES = int(os.getenv("STEP_MAX_RETRIES", "2"))
+        
+        # Data extraction - output token budget per LLM call
+        self.EXTRACTION_MAX_TOKENS = int(os.getenv("EXTRACTION_MAX_TOKENS", "1024"))
+        
+        # Seconds a cached extraction stays valid for an identical tool output
+        self.EXTRACTION_CACHE_TTL = float(os.getenv("EXTRACTION_CACHE_TTL", "300"))
+        
+        # Set LUFFY_GUIDED_JSON=0 to stop sending a JSON schema with extraction requests
+        self.EXTRACTION_GUIDED_JSON = os.getenv("LUFFY_GUIDED_JSON", "1") != "0"
+        
+        # Set LUFFY_LLM_EXTRACT=0 to extract known tool outputs with rules instead of the LLM
+        self.LLM_EXTRACT = os.getenv("LUFFY_LLM_EXTRACT", "1") != "0"
+        
         # Only validate if not in development mode
         if not os.getenv("SKIP_VALIDATION"):
             self.validate()
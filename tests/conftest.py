@@ -0,0 +1,8 @@
+import os
+import sys
+
+# config.Settings validates its environment on import - tests never reach NVIDIA or Google
+os.environ.setdefault("NVIDIA_API_KEY", "nvapi-test")
+os.environ.setdefault("SKIP_VALIDATION", "1")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
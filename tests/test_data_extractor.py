@@ -0,0 +1,195 @@
+from types import SimpleNamespace
+
+import json
+
+import pytest
+from requests.exceptions import ConnectionError as RequestsConnectionError
+
+from agents import data_extractor
+from agents.data_extractor import DataExtractor, _JsonObjectScanner
+from agents.plan_schema import ActionType, ToolType, step_result_from_output
+
+
+@pytest.fixture(scope="module")
+def extractor():
+    return DataExtractor()
+
+
+class ScriptedLLM:
+    """Stands in for ChatNVIDIA.stream - each call raises or streams the next scripted outcome"""
+    
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = []
+    
+    def stream(self, messages, **kwargs):
+        self.calls.append(kwargs)
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return (SimpleNamespace(content=chunk) for chunk in [outcome])
+
+
+@pytest.fixture
+def guided_extractor(monkeypatch):
+    """A private extractor with guided decoding on - these tests change its LLM and flag"""
+    monkeypatch.setattr(data_extractor.time, "sleep", lambda seconds: None)
+    extractor = DataExtractor()
+    extractor.guided_json = True
+    return extractor
+
+
+def make_step(step_index, tool, action):
+    return {
+        'step_index': step_index,
+        'tool': tool,
+        'action': action,
+        'description': f"Step {step_index}",
+        'parameters': {},
+        'dependencies': [],
+        'expected_outputs': [],
+        'routing_logic': None
+    }
+
+
+def extract_final_step(extractor, tool, action, data):
+    """Extraction for the last step of a plan - the rule-based path, no LLM call"""
+    step_result = step_result_from_output(1, tool, action, {'success': True, 'data': data})
+    return extractor.extract_data(step_result, make_step(1, tool, action), [], {})
+
+
+@pytest.mark.parametrize("tool, action, data, key", [
+    (ToolType.GMAIL, ActionType.SEND_EMAIL, {'message_id': "m1", 'thread_id': "t1", 'attachment_count': 0}, 'message_id'),
+    (ToolType.CALENDAR, ActionType.CREATE_EVENT, {'event_id': "e1", 'event_link': "", 'attendees': []}, 'event_id'),
+    (ToolType.DRIVE, ActionType.UPLOAD_FILE, {'file_id': "f1", 'filename': "a.txt"}, 'file_id'),
+])
+def test_final_step_result_reaches_shared_context(extractor, tool, action, data, key):
+    extracted = extract_final_step(extractor, tool, action, data)
+    
+    # The graph merges for_future_steps into shared_context, where the final response looks for these keys
+    assert extracted['for_future_steps'][key] == data[key]
+
+
+def test_meet_link_is_published_as_meeting_link(extractor):
+    data = {'event_id': "e1", 'meet_link': "https://meet.google.com/abc", 'attendees': [{'email': "a@example.com"}]}
+    
+    extracted = extract_final_step(extractor, ToolType.CALENDAR, ActionType.CREATE_EVENT, data)
+    
+    assert extracted['for_future_steps']['meeting_link'] == "https://meet.google.com/abc"
+    assert extracted['for_future_steps']['meeting_attendees'] == ["a@example.com"]
+
+
+def scan(*chunks):
+    """Feed chunks to a scanner, returning the end offset and the fed text"""
+    scanner = _JsonObjectScanner()
+    for chunk in chunks:
+        end = scanner.feed(chunk)
+        if end is not None:
+            return scanner, end
+    return scanner, None
+
+
+def test_scanner_stops_at_the_first_closed_object():
+    text = '{"extracted_data": {"a": "}"}} trailing commentary {"x": 1}'
+    
+    scanner, end = scan(text[:10], text[10:25], text[25:])
+    
+    assert text[scanner.start:end] == '{"extracted_data": {"a": "}"}}'
+
+
+def test_scanner_skips_braces_in_prose_that_are_not_json():
+    text = 'Here is the {result}:\n{"extracted_data": {}}'
+    
+    scanner, end = scan(text)
+    
+    assert text[scanner.start:end] == '{"extracted_data": {}}'
+
+
+def test_scanner_keeps_reading_when_no_object_parses():
+    scanner, end = scan('{result} and {a: 1}')
+    
+    assert end is None
+
+
+def test_stream_read_returns_only_the_json_object(extractor):
+    chunks = ['Sure! Here is the {result}:\n{"extracted_', 'data": {"id": 1}}', '\nNote: done']
+    stream = (SimpleNamespace(content=chunk) for chunk in chunks)
+    
+    assert extractor._read_json_stream(stream) == '{"extracted_data": {"id": 1}}'
+
+
+@pytest.mark.parametrize("content, expected", [
+    ('{a: 1, b: "two"}', {'a': 1, 'b': "two"}),
+    ('{"a": [1, 2,], "b": {"c": 3,},}', {'a': [1, 2], 'b': {'c': 3}}),
+    # Key-like text and trailing commas inside string values are left alone
+    ('{a: "x, b: y", c: 1}', {'a': "x, b: y", 'c': 1}),
+    ('{note: "ends with ,}", link: "http://example.com"}', {'note': "ends with ,}", 'link': "http://example.com"}),
+    ('{a: "say \\"b: c\\""}', {'a': 'say "b: c"'}),
+    ('"step": 1, status: "done"', {'step': 1, 'status': "done"}),
+])
+def test_fix_common_json_issues(extractor, content, expected):
+    assert json.loads(extractor._fix_common_json_issues(content)) == expected
+
+
+def test_transient_llm_error_keeps_guided_decoding(guided_extractor):
+    guided_extractor.llm = ScriptedLLM(Exception("[503] Service Unavailable\nbusy"), '{"extracted_data": {}}')
+    
+    assert guided_extractor._stream_json_response([]) == '{"extracted_data": {}}'
+    assert guided_extractor.guided_json is True
+    assert all('nvext' in call for call in guided_extractor.llm.calls)
+
+
+def test_connection_error_is_retried(guided_extractor):
+    guided_extractor.llm = ScriptedLLM(RequestsConnectionError("reset"), '{"extracted_data": {}}')
+    
+    assert guided_extractor._stream_json_response([]) == '{"extracted_data": {}}'
+    assert guided_extractor.guided_json is True
+
+
+def test_rejected_schema_disables_guided_decoding(guided_extractor):
+    guided_extractor.llm = ScriptedLLM(Exception("[422] Unprocessable Entity\nnvext"), '{"extracted_data": {}}')
+    
+    assert guided_extractor._stream_json_response([]) == '{"extracted_data": {}}'
+    assert guided_extractor.guided_json is False
+    assert 'nvext' not in guided_extractor.llm.calls[-1]
+
+
+def test_persistent_llm_failure_raises_after_bounded_attempts(guided_extractor):
+    guided_extractor.llm = ScriptedLLM(*[Exception("[502] Bad Gateway")] * 5)
+    
+    with pytest.raises(Exception, match="502"):
+        guided_extractor._stream_json_response([])
+    assert len(guided_extractor.llm.calls) == 3
+    assert guided_extractor.guided_json is True
+
+
+def test_auth_error_is_not_retried(guided_extractor):
+    guided_extractor.llm = ScriptedLLM(Exception("[401] Unauthorized"), '{"extracted_data": {}}')
+    
+    with pytest.raises(Exception, match="401"):
+        guided_extractor._stream_json_response([])
+    assert guided_extractor.guided_json is True
+
+
+def test_cached_extraction_is_scoped_to_the_plan(guided_extractor, monkeypatch):
+    monkeypatch.setattr(data_extractor.settings, "LLM_EXTRACT", True)
+    monkeypatch.setattr(data_extractor, "_extraction_cache", data_extractor.OrderedDict())
+    guided_extractor.llm = ScriptedLLM(
+        '{"extracted_data": {}, "for_future_steps": {"recipient": "a@example.com"}}',
+        '{"extracted_data": {}, "for_future_steps": {"file_name": "report.pdf"}}',
+    )
+    step_result = step_result_from_output(
+        1, ToolType.GMAIL, ActionType.READ_EMAILS, {'success': True, 'data': {'emails': []}}
+    )
+    completed_step = make_step(1, ToolType.GMAIL, ActionType.READ_EMAILS)
+    reply_plan = [make_step(2, ToolType.GMAIL, ActionType.SEND_EMAIL)]
+    upload_plan = [make_step(2, ToolType.DRIVE, ActionType.UPLOAD_FILE)]
+    
+    first = guided_extractor.extract_data(step_result, completed_step, reply_plan, {})
+    second = guided_extractor.extract_data(step_result, completed_step, upload_plan, {})
+    repeat = guided_extractor.extract_data(step_result, completed_step, reply_plan, {})
+    
+    assert len(guided_extractor.llm.calls) == 2
+    assert first['for_future_steps'] == {'recipient': 'a@example.com'}
+    assert second['for_future_steps'] == {'file_name': 'report.pdf'}
+    assert repeat == first
@@ -0,0 +1,53 @@
+from unittest import mock
+
+import pytest
+
+from tools import drive_tool
+from tools.drive_tool import DriveTool
+
+
+def make_downloader(chunks, error=None):
+    """MediaIoBaseDownload stand-in that writes the given chunks, then raises error if one is set"""
+    
+    class FakeDownloader:
+        def __init__(self, fd, request, chunksize):
+            self.fd = fd
+            self.remaining = list(chunks)
+        
+        def next_chunk(self):
+            if not self.remaining:
+                raise error
+            self.fd.write(self.remaining.pop(0))
+            return None, not self.remaining and error is None
+    
+    return FakeDownloader
+
+
+@pytest.fixture
+def service():
+    service = mock.MagicMock()
+    service.files.return_value.get.return_value.execute.return_value = {'name': "report.pdf"}
+    return service
+
+
+def test_download_moves_the_complete_file_into_place(service, tmp_path, monkeypatch):
+    monkeypatch.setattr(drive_tool, "MediaIoBaseDownload", make_downloader([b"abc", b"def"]))
+    
+    result = DriveTool().download_file(service, "file-1", str(tmp_path))
+    
+    assert result['success'] is True
+    assert (tmp_path / "report.pdf").read_bytes() == b"abcdef"
+    assert result['data']['file_size'] == 6
+    assert [path.name for path in tmp_path.iterdir()] == ["report.pdf"]
+
+
+def test_failed_download_leaves_no_partial_file(service, tmp_path, monkeypatch):
+    target = tmp_path / "report.pdf"
+    target.write_bytes(b"previous version")
+    monkeypatch.setattr(drive_tool, "MediaIoBaseDownload", make_downloader([b"abc"], error=ConnectionError("reset")))
+    
+    result = DriveTool().download_file(service, "file-1", str(target))
+    
+    assert result['success'] is False
+    assert target.read_bytes() == b"previous version"
+    assert [path.name for path in tmp_path.iterdir()] == ["report.pdf"]
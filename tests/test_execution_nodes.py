@@ -0,0 +1,150 @@
+import threading
+from unittest import mock
+
+import httplib2
+import pytest
+from google.auth.exceptions import RefreshError
+from googleapiclient.errors import HttpError
+
+from agents import execution_nodes
+from agents.execution_nodes import GmailNode, NodeFactory
+from agents.plan_schema import ActionType, ToolType
+
+
+class FakeAuthManager:
+    """Hands out a new mock Gmail client on every call while the user is signed in"""
+    
+    def __init__(self):
+        self.clients = []
+        self.signed_in = True
+    
+    def is_authenticated(self, user_id):
+        return self.signed_in
+    
+    def get_authenticated_client(self, service_name, version, user_id):
+        client = mock.MagicMock(name=f"{service_name}-client")
+        self.clients.append(client)
+        return client
+
+
+def http_error(status, headers=None):
+    return HttpError(httplib2.Response({'status': status, **(headers or {})}), b'{}', uri="https://gmail.googleapis.com")
+
+
+def read_emails(node):
+    context = {'shared_context': {}, 'step_parameters': {'max_results': 5}, 'user_id': "user"}
+    return node.execute(1, ToolType.GMAIL, ActionType.READ_EMAILS, context)
+
+
+def list_call(client):
+    return client.users.return_value.messages.return_value.list.return_value.execute
+
+
+@pytest.fixture
+def auth_manager():
+    return FakeAuthManager()
+
+
+@pytest.fixture
+def node(auth_manager):
+    return GmailNode(auth_manager)
+
+
+def test_client_is_reused_within_its_ttl(node, auth_manager):
+    assert node._get_client("user") is node._get_client("user")
+    assert len(auth_manager.clients) == 1
+
+
+def test_client_is_rebuilt_after_its_ttl(node, auth_manager, monkeypatch):
+    monkeypatch.setattr(execution_nodes.settings, "GOOGLE_CLIENT_CACHE_TTL", 0)
+    
+    first = node._get_client("user")
+    
+    assert node._get_client("user") is not first
+    assert len(auth_manager.clients) == 2
+
+
+def test_clients_are_cached_per_user(node, auth_manager):
+    assert node._get_client("alice") is not node._get_client("bob")
+    assert node._get_client("alice") is auth_manager.clients[0]
+
+
+def test_clients_are_cached_per_thread(node, auth_manager):
+    ours = node._get_client("user")
+    theirs = []
+    worker = threading.Thread(target=lambda: theirs.append(node._get_client("user")))
+    worker.start()
+    worker.join()
+    
+    assert theirs[0] is not ours
+
+
+def test_cached_client_is_dropped_after_logout(node, auth_manager):
+    node._get_client("user")
+    auth_manager.signed_in = False
+    
+    assert node._get_client("user") is None
+    
+    auth_manager.signed_in = True
+    assert node._get_client("user") is auth_manager.clients[1]
+
+
+def test_transient_http_error_is_retryable(node, auth_manager):
+    node._get_client("user")
+    list_call(auth_manager.clients[0]).side_effect = http_error(503, {'retry-after': "7"})
+    
+    result = read_emails(node)
+    
+    assert result['status'] == "retryable"
+    assert result['retry_after'] == 7.0
+
+
+def test_fatal_http_error_fails_the_step(node, auth_manager):
+    node._get_client("user")
+    list_call(auth_manager.clients[0]).side_effect = http_error(404)
+    
+    result = read_emails(node)
+    
+    assert result['status'] == "failed"
+    assert "HTTP 404" in result['error_message']
+
+
+def test_refresh_error_drops_the_cached_client(node, auth_manager):
+    node._get_client("user")
+    list_call(auth_manager.clients[0]).side_effect = RefreshError("invalid_grant")
+    
+    result = read_emails(node)
+    
+    assert result['status'] == "failed"
+    assert node._get_client("user") is auth_manager.clients[1]
+
+
+def test_unsupported_action_fails_only_its_step(auth_manager):
+    node = NodeFactory(auth_manager).resolve(ToolType.GMAIL, ActionType.CREATE_EVENT)
+    
+    result = node.execute(2, ToolType.GMAIL, ActionType.CREATE_EVENT, {'user_id': "user"})
+    
+    assert result['status'] == "failed"
+    assert result['step_index'] == 2
+    assert "create_event" in result['error_message']
+    assert auth_manager.clients == []
+
+
+def test_supported_action_resolves_to_its_tool_node(auth_manager):
+    factory = NodeFactory(auth_manager)
+    
+    assert factory.resolve(ToolType.GMAIL, ActionType.SEND_EMAIL) is factory.get_node(ToolType.GMAIL)
+
+
+def test_factories_are_shared_per_auth_manager(auth_manager, monkeypatch):
+    monkeypatch.setattr(NodeFactory, "_instances", execution_nodes.OrderedDict())
+    other_manager = FakeAuthManager()
+    
+    factory = NodeFactory.instance(auth_manager)
+    other = NodeFactory.instance(other_manager)
+    
+    assert NodeFactory.instance(auth_manager) is factory
+    assert other is not factory
+    # Another session's manager never rebinds nodes this one's graphs may be running
+    assert factory.get_node(ToolType.GMAIL).auth_manager is auth_manager
+    assert other.get_node(ToolType.GMAIL).auth_manager is other_manager
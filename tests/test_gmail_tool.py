@@ -0,0 +1,97 @@
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+from tools import gmail_tool
+from tools.gmail_tool import GmailTool
+
+
+def http_error(status):
+    return HttpError(httplib2.Response({'status': status}), b'{}')
+
+
+class FakeRequest:
+    """Unexecuted API request - returns its response, or raises its errors one call at a time"""
+    
+    def __init__(self, response, errors=()):
+        self.response = response
+        self.errors = list(errors)
+        self.calls = 0
+    
+    def execute(self, num_retries=0):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return self.response
+
+
+class FakeBatch:
+    def __init__(self, service, callback):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+    
+    def add(self, request, request_id):
+        self.requests.append((request_id, request))
+    
+    def execute(self):
+        self.service.batch_sizes.append(len(self.requests))
+        for request_id, request in self.requests:
+            try:
+                self.callback(request_id, request.execute(), None)
+            except HttpError as e:
+                self.callback(request_id, None, e)
+
+
+class FakeService:
+    def __init__(self):
+        self.batch_sizes = []
+    
+    def new_batch_http_request(self, callback):
+        return FakeBatch(self, callback)
+
+
+def test_batches_hold_at_most_fifty_requests():
+    service = FakeService()
+    requests = [FakeRequest({'id': str(i)}) for i in range(120)]
+    
+    responses = GmailTool()._execute_batched(service, requests)
+    
+    assert service.batch_sizes == [50, 50, 20]
+    assert [response['id'] for response in responses] == [str(i) for i in range(120)]
+
+
+def test_rate_limited_items_are_retried_individually():
+    requests = [FakeRequest({'id': "a"}), FakeRequest({'id': "b"}, errors=[http_error(429)])]
+    
+    responses = GmailTool()._execute_batched(FakeService(), requests)
+    
+    assert responses == [{'id': "a"}, {'id': "b"}]
+    assert requests[1].calls == 2
+
+
+def test_failed_items_are_logged_not_printed(caplog, capsys):
+    requests = [FakeRequest({'id': "a"}), FakeRequest(None, errors=[http_error(404)])]
+    
+    with caplog.at_level("WARNING", logger=gmail_tool.__name__):
+        responses = GmailTool()._execute_batched(FakeService(), requests)
+    
+    assert responses == [{'id': "a"}, None]
+    assert "1 of 2 Gmail messages could not be fetched" in caplog.text
+    assert capsys.readouterr().out == ""
+
+
+@pytest.mark.parametrize("status", [401, 403])
+def test_auth_errors_fail_the_whole_call(status):
+    requests = [FakeRequest({'id': "a"}), FakeRequest(None, errors=[http_error(status)])]
+    
+    with pytest.raises(HttpError) as raised:
+        GmailTool()._execute_batched(FakeService(), requests)
+    assert raised.value.resp.status == status
+
+
+def test_auth_error_on_retry_fails_the_whole_call():
+    requests = [FakeRequest({'id': "a"}), FakeRequest(None, errors=[http_error(503), http_error(401)])]
+    
+    with pytest.raises(HttpError):
+        GmailTool()._execute_batched(FakeService(), requests)
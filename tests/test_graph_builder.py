@@ -0,0 +1,324 @@
+import threading
+from unittest import mock
+
+import pytest
+
+from agents import graph_builder
+from agents.execution_nodes import GmailNode, NodeFactory
+from agents.graph_builder import GraphBuilder
+from agents.plan_schema import (
+    ActionType, ToolType, add_execution_log, latest_step, merge_shared_context, merge_status,
+    merge_step_results, retryable_step_result, step_result_from_output
+)
+
+
+class FakeNode:
+    """Execution node that succeeds with the step index as its data"""
+    
+    def __init__(self, calls):
+        self.calls = calls
+    
+    def execute(self, step_index, tool, action, context, client=None):
+        self.calls.append((step_index, context))
+        return step_result_from_output(step_index, tool, action, {'success': True, 'data': {'step': step_index}})
+
+
+class BarrierNode(FakeNode):
+    """Execution node where the given steps only finish once all of them are running at the same time"""
+    
+    def __init__(self, calls, steps):
+        super().__init__(calls)
+        self.steps = steps
+        self.barrier = threading.Barrier(len(steps), timeout=5)
+    
+    def execute(self, step_index, tool, action, context, client=None):
+        if step_index in self.steps:
+            self.barrier.wait()
+        return super().execute(step_index, tool, action, context)
+
+
+class FailingNode(FakeNode):
+    def execute(self, step_index, tool, action, context, client=None):
+        self.calls.append((step_index, context))
+        return step_result_from_output(step_index, tool, action, {'success': False, 'error': "boom"})
+
+
+class FlakyNode(FakeNode):
+    """Execution node that hits a transient API error on the first `failures` attempts"""
+    
+    def __init__(self, calls, failures):
+        super().__init__(calls)
+        self.failures = failures
+    
+    def execute(self, step_index, tool, action, context, client=None):
+        if self.failures:
+            self.failures -= 1
+            self.calls.append((step_index, context))
+            return retryable_step_result(step_index, tool, action, "HTTP 503", retry_after=3.0)
+        return super().execute(step_index, tool, action, context)
+
+
+class FakeNodeFactory:
+    def __init__(self):
+        self.calls = []
+        self.node = FakeNode(self.calls)
+    
+    def resolve(self, tool, action):
+        return self.node
+    
+    def prewarm(self, user_id, steps):
+        return {}
+
+
+class ThreadBoundAuthManager:
+    """Signed in only on the thread that created it - Streamlit's session state is empty on other threads"""
+    
+    def __init__(self):
+        self.thread = threading.current_thread()
+    
+    def is_authenticated(self, user_id):
+        return threading.current_thread() is self.thread
+    
+    def get_authenticated_client(self, service_name, version, user_id):
+        if not self.is_authenticated(user_id):
+            return None
+        return mock.MagicMock(name=f"{service_name}-client")
+
+
+class FakeExtractor:
+    """Publishes every step's result to shared_context under its own key"""
+    
+    def extract_data(self, step_result, step, remaining_steps, shared_context):
+        key = f"step_{step_result['step_index']}_done"
+        return {"extracted_data": {key: True}, "context_updates": {}, "for_future_steps": {key: True}}
+
+
+class BarrierExtractor(FakeExtractor):
+    """Extractor where steps 1 and 2 only finish extracting once both are extracting at the same time"""
+    
+    def __init__(self):
+        self.barrier = threading.Barrier(2, timeout=5)
+    
+    def extract_data(self, step_result, step, remaining_steps, shared_context):
+        if step_result['step_index'] in (1, 2):
+            self.barrier.wait()
+        return super().extract_data(step_result, step, remaining_steps, shared_context)
+
+
+def make_step(step_index, dependencies):
+    return {
+        'step_index': step_index,
+        'tool': ToolType.GMAIL,
+        'action': ActionType.READ_EMAILS,
+        'description': f"Step {step_index}",
+        'parameters': {},
+        'dependencies': dependencies,
+        'expected_outputs': [],
+        'routing_logic': None
+    }
+
+
+def make_plan(*steps):
+    return {'intent': "test", 'steps': list(steps), 'estimated_duration': "", 'requires_confirmation': False}
+
+
+def initial_state(plan):
+    return {
+        'plan': plan,
+        'step_results': {},
+        'shared_context': {},
+        'current_step': 1,
+        'status': "executing",
+        'user_id': "user",
+        'created_at': "",
+        'execution_log': []
+    }
+
+
+def run(graph, plan):
+    states = list(graph.stream(initial_state(plan), config={"configurable": {"thread_id": "test"}}, stream_mode="values"))
+    return states[-1]
+
+
+@pytest.fixture
+def factory(monkeypatch):
+    factory = FakeNodeFactory()
+    monkeypatch.setattr(graph_builder.NodeFactory, "instance", classmethod(lambda cls, auth_manager: factory))
+    monkeypatch.setattr(graph_builder, "get_extractor", FakeExtractor)
+    # Compiled graphs bind their nodes - never reuse one built against another test's fakes
+    monkeypatch.setattr(graph_builder, "_compiled_graphs", graph_builder.OrderedDict())
+    return factory
+
+
+def test_fan_out_steps_merge_without_conflicts(factory):
+    plan = make_plan(make_step(1, []), make_step(2, []), make_step(3, [1, 2]))
+    
+    final_state = run(GraphBuilder(auth_manager=None).build_graph(plan, "user"), plan)
+    
+    assert sorted(final_state['step_results']) == [1, 2, 3]
+    assert all(result['status'] == "completed" for result in final_state['step_results'].values())
+    assert final_state['shared_context'] == {'step_1_done': True, 'step_2_done': True, 'step_3_done': True}
+    assert final_state['status'] == "completed"
+    assert final_state['current_step'] == 4
+    assert len(final_state['execution_log']) == 3
+
+
+def test_fan_in_step_sees_every_dependency(factory):
+    plan = make_plan(make_step(1, []), make_step(2, []), make_step(3, [1, 2]))
+    
+    run(GraphBuilder(auth_manager=None).build_graph(plan, "user"), plan)
+    
+    context = dict(factory.calls)[3]
+    assert context['step_1_data'] == {'step_1_done': True}
+    assert context['step_2_data'] == {'step_2_done': True}
+
+
+def test_fan_out_completes_only_after_every_branch(factory):
+    plan = make_plan(make_step(1, []), make_step(2, [1]), make_step(3, []))
+    
+    states = list(GraphBuilder(auth_manager=None).build_graph(plan, "user").stream(
+        initial_state(plan), config={"configurable": {"thread_id": "test"}}, stream_mode="values"
+    ))
+    
+    # Step 3 ends a superstep before step 2 - the plan isn't done until the join
+    assert [state['status'] for state in states] == ["executing", "executing", "executing", "completed"]
+    assert sorted(states[-1]['step_results']) == [1, 2, 3]
+
+
+def test_independent_steps_run_concurrently(factory):
+    factory.node = BarrierNode(factory.calls, steps={1, 2})
+    plan = make_plan(make_step(1, []), make_step(2, []))
+    
+    final_state = run(GraphBuilder(auth_manager=None).build_graph(plan, "user"), plan)
+    
+    assert final_state['status'] == "completed"
+
+
+def test_steps_after_a_shared_dependency_fan_out(factory):
+    factory.node = BarrierNode(factory.calls, steps={2, 3})
+    plan = make_plan(make_step(1, []), make_step(2, [1]), make_step(3, [1]), make_step(4, [2, 3]))
+    
+    final_state = run(GraphBuilder(auth_manager=None).build_graph(plan, "user"), plan)
+    
+    assert final_state['status'] == "completed"
+    assert [step_index for step_index, _ in factory.calls][0] == 1
+    assert [step_index for step_index, _ in factory.calls][-1] == 4
+
+
+def test_sibling_extractions_overlap(factory, monkeypatch):
+    monkeypatch.setattr(graph_builder, "get_extractor", BarrierExtractor)
+    plan = make_plan(make_step(1, []), make_step(2, []), make_step(3, [1, 2]))
+    
+    final_state = run(GraphBuilder(auth_manager=None).build_graph(plan, "user"), plan)
+    
+    assert final_state['status'] == "completed"
+    assert final_state['shared_context'] == {'step_1_done': True, 'step_2_done': True, 'step_3_done': True}
+
+
+def test_failed_branch_outranks_completion(factory):
+    factory.node = FailingNode(factory.calls)
+    plan = make_plan(make_step(1, []), make_step(2, []))
+    
+    final_state = run(GraphBuilder(auth_manager=None).build_graph(plan, "user"), plan)
+    
+    assert final_state['status'] == "failed"
+
+
+def test_transient_failure_is_retried_after_backoff(factory, monkeypatch):
+    delays = []
+    monkeypatch.setattr(graph_builder.time, "sleep", delays.append)
+    monkeypatch.setattr(graph_builder.settings, "STEP_MAX_RETRIES", 2)
+    factory.node = FlakyNode(factory.calls, failures=2)
+    plan = make_plan(make_step(1, []))
+    
+    final_state = run(GraphBuilder(auth_manager=None).build_graph(plan, "user"), plan)
+    
+    assert final_state['status'] == "completed"
+    assert final_state['step_results'][1]['status'] == "completed"
+    # Retry-After wins over the backoff until the backoff grows past it
+    assert delays == [3.0, 3.0]
+
+
+def test_transient_failure_fails_the_step_once_retries_run_out(factory, monkeypatch):
+    delays = []
+    monkeypatch.setattr(graph_builder.time, "sleep", delays.append)
+    monkeypatch.setattr(graph_builder.settings, "STEP_MAX_RETRIES", 1)
+    factory.node = FlakyNode(factory.calls, failures=5)
+    plan = make_plan(make_step(1, []))
+    
+    final_state = run(GraphBuilder(auth_manager=None).build_graph(plan, "user"), plan)
+    
+    assert final_state['status'] == "failed"
+    assert final_state['step_results'][1]['status'] == "failed"
+    assert len(factory.calls) == 2
+    assert len(delays) == 1
+
+
+def test_single_step_plan_completes(factory):
+    plan = make_plan(make_step(1, []))
+    
+    states = list(GraphBuilder(auth_manager=None).build_graph(plan, "user").stream(
+        initial_state(plan), config={"configurable": {"thread_id": "test"}}, stream_mode="values"
+    ))
+    
+    assert states[-1]['status'] == "completed"
+    assert states[-1]['current_step'] == 2
+    assert list(states[-1]['step_results']) == [1]
+
+
+def test_state_reducers_follow_workflow_state_annotations():
+    assert graph_builder._STATE_REDUCERS == {
+        'step_results': merge_step_results,
+        'shared_context': merge_shared_context,
+        'current_step': latest_step,
+        'status': merge_status,
+        'execution_log': add_execution_log
+    }
+
+
+def test_cached_graph_gets_a_fresh_checkpointer(factory):
+    builder = GraphBuilder(auth_manager=None)
+    first_plan = make_plan(make_step(1, []), make_step(2, [1]))
+    second_plan = make_plan(make_step(1, []), make_step(2, [1]))
+    second_plan['steps'][1]['description'] = "Same shape, different plan"
+    
+    first = builder.build_graph(first_plan, "user")
+    first_state = run(first, first_plan)
+    second = builder.build_graph(second_plan, "user")
+    second_state = run(second, second_plan)
+    
+    cached_graph = next(iter(graph_builder._compiled_graphs.values()))
+    assert len(graph_builder._compiled_graphs) == 1
+    # Even the first build hands out a copy - the cached graph holds no run state
+    assert cached_graph.checkpointer is None
+    assert first is not cached_graph and second is not first
+    assert second.checkpointer is not first.checkpointer
+    # Same thread_id - a shared checkpointer would have carried the first run's log into the second
+    assert len(first_state['execution_log']) == len(second_state['execution_log']) == 2
+    assert second_state['execution_log'][-1].endswith("Same shape, different plan")
+
+
+@pytest.mark.parametrize("plan", [
+    make_plan(make_step(1, [])),
+    make_plan(make_step(1, []), make_step(2, []), make_step(3, [1, 2]))
+], ids=["single-step", "fan-out"])
+def test_steps_use_clients_built_on_the_calling_thread(plan, monkeypatch):
+    monkeypatch.setattr(graph_builder.NodeFactory, "instance", classmethod(lambda cls, auth_manager: NodeFactory(auth_manager)))
+    monkeypatch.setattr(graph_builder, "get_extractor", FakeExtractor)
+    monkeypatch.setattr(graph_builder, "_compiled_graphs", graph_builder.OrderedDict())
+    clients = []
+    
+    def call_tool_method(self, action, client, params):
+        clients.append(client)
+        return {'success': True, 'data': {}}
+    monkeypatch.setattr(GmailNode, "_call_tool_method", call_tool_method)
+    builder = GraphBuilder(ThreadBoundAuthManager())
+    
+    config = {"configurable": {"thread_id": "test", **builder.client_config(plan, "user")}}
+    states = list(builder.build_graph(plan, "user").stream(initial_state(plan), config=config, stream_mode="values"))
+    final_state = states[-1]
+    
+    assert final_state['status'] == "completed"
+    assert {result['status'] for result in final_state['step_results'].values()} == {"completed"}
+    # Each step gets its own client - sibling steps never share an httplib2 connection
+    assert len(clients) == len(set(map(id, clients))) == len(plan['steps'])
@@ -0,0 +1,64 @@
+import pytest
+
+from agents.plan_schema import ActionType, ToolType, latest_step, merge_status, plan_levels
+
+
+def make_step(step_index, dependencies):
+    return {
+        'step_index': step_index,
+        'tool': ToolType.GMAIL,
+        'action': ActionType.READ_EMAILS,
+        'description': f"Step {step_index}",
+        'parameters': {},
+        'dependencies': dependencies,
+        'expected_outputs': [],
+        'routing_logic': None
+    }
+
+
+def level_indexes(steps):
+    return [[step['step_index'] for step in level] for level in plan_levels(steps)]
+
+
+def test_sequential_plan_has_one_step_per_level():
+    assert level_indexes([make_step(1, []), make_step(2, [1]), make_step(3, [2])]) == [[1], [2], [3]]
+
+
+def test_independent_steps_share_a_level():
+    steps = [make_step(1, []), make_step(2, []), make_step(3, [1, 2]), make_step(4, [1])]
+    
+    assert level_indexes(steps) == [[1, 2], [3, 4]]
+
+
+def test_levels_ignore_step_order():
+    steps = [make_step(3, [1, 2]), make_step(2, [1]), make_step(1, [])]
+    
+    assert level_indexes(steps) == [[1], [2], [3]]
+
+
+def test_unknown_dependency_is_rejected():
+    with pytest.raises(ValueError, match="unknown steps"):
+        plan_levels([make_step(1, []), make_step(2, [5])])
+
+
+def test_dependency_cycle_is_rejected():
+    with pytest.raises(ValueError, match="cycle"):
+        plan_levels([make_step(1, []), make_step(2, [3]), make_step(3, [2])])
+
+
+@pytest.mark.parametrize("existing, new, expected", [
+    ("", "executing", "executing"),
+    ("executing", "executing", "executing"),
+    ("executing", "completed", "completed"),
+    ("completed", "executing", "completed"),
+    ("executing", "failed", "failed"),
+    ("failed", "completed", "failed"),
+])
+def test_merge_status_keeps_the_strongest_status(existing, new, expected):
+    assert merge_status(existing, new) == expected
+
+
+def test_latest_step_never_moves_backwards():
+    assert latest_step(3, 2) == 3
+    assert latest_step(2, 3) == 3
+    assert latest_step(None, 1) == 1
@@ -1,5 +1,6 @@
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional, Union
+from tools.tool_result import failure_result
 import uuid
 
 class CalendarTool:
@@ -38,12 +39,7 @@ class CalendarTool:
             }
             
         except Exception as e:
-            return {
-                'success': False,
-                'data': None,
-                'error': str(e),
-                'message': f"Failed to create event: {str(e)}"
-            }
+            return failure_result(e, "Failed to create event")
     
     def create_meet_event(self, google_client, title: str, start_time: Union[str, datetime],
                          end_time: Union[str, datetime], description: Optional[str] = None,
@@ -92,12 +88,7 @@ class CalendarTool:
             }
             
         except Exception as e:
-            return {
-                'success': False,
-                'data': None,
-                'error': str(e),
-                'message': f"Failed to create Meet event: {str(e)}"
-            }
+            return failure_result(e, "Failed to create Meet event")
     
     def list_events(self, google_client, start_date: Union[str, datetime],
                    end_date: Optional[Union[str, datetime]] = None,
@@ -156,12 +147,7 @@ class CalendarTool:
             }
             
         except Exception as e:
-            return {
-                'success': False,
-                'data': None,
-                'error': str(e),
-                'message': f"Failed to list events: {str(e)}"
-            }
+            return failure_result(e, "Failed to list events")
     
     def update_event(self, google_client, event_id: str, title: Optional[str] = None,
                     start_time: Optional[Union[str, datetime]] = None,
@@ -228,12 +214,7 @@ class CalendarTool:
             }
             
         except Exception as e:
-            return {
-                'success': False,
-                'data': None,
-                'error': str(e),
-                'message': f"Failed to update event: {str(e)}"
-            }
+            return failure_result(e, "Failed to update event")
     
     def delete_event(self, google_client, event_id: str) -> Dict[str, Any]:
         """Delete a calendar event"""
@@ -258,12 +239,7 @@ class CalendarTool:
             }
             
         except Exception as e:
-            return {
-                'success': False,
-                'data': None,
-                'error': str(e),
-                'message': f"Failed to delete event: {str(e)}"
-            }
+            return failure_result(e, "Failed to delete event")
     
     def get_meet_link_from_event(self, google_client, event_id: str) -> Dict[str, Any]:
         """Extract Google Meet link from existing event"""
@@ -302,12 +278,7 @@ class CalendarTool:
                 }
             
         except Exception as e:
-            return {
-                'success': False,
-                'data': None,
-                'error': str(e),
-                'message': f"Failed to get Meet link: {str(e)}"
-            }
+            return failure_result(e, "Failed to get Meet link")
     
     def _build_event_object(self, title: str, start_time: Union[str, datetime],
                            end_time: Union[str, datetime], description: Optional[str],
@@ -1,9 +1,14 @@
 import os
 import io
+import tempfile
 from typing import List, Dict, Any, Optional, Union
+from tools.tool_result import failure_result
 import mimetypes
 from googleapiclient.http import MediaIoBaseDownload, MediaFileUpload, MediaIoBaseUpload
 
+# Transfer size for chunked uploads/downloads; smaller uploads go in a single request
+_CHUNK_SIZE = 8 * 1024 * 1024
+
 class DriveTool:
     """Google Drive operations tool for file management"""
     
@@ -26,7 +31,9 @@ class DriveTool:
                 
                 filename = filename or os.path.basename(file_path)
                 mime_type, _ = mimetypes.guess_type(file_path)
-                media = MediaFileUpload(file_path, mimetype=mime_type)
+                resumable = os.path.getsize(file_path) > _CHUNK_SIZE
+                media = MediaFileUpload(file_path, mimetype=mime_type,
+                                        chunksize=_CHUNK_SIZE, resumable=resumable)
                 
             elif file_content and filename:
                 mime_type, _ = mimetypes.guess_type(filename)
@@ -34,7 +41,9 @@ class DriveTool:
                     mime_type = 'application/octet-stream'
                 
                 file_stream = io.BytesIO(file_content)
-                media = MediaIoBaseUpload(file_stream, mimetype=mime_type)
+                resumable = len(file_content) > _CHUNK_SIZE
+                media = MediaIoBaseUpload(file_stream, mimetype=mime_type,
+                                          chunksize=_CHUNK_SIZE, resumable=resumable)
                 
             else:
                 raise ValueError("Either file_path or (file_content + filename) must be provided")
@@ -50,12 +59,18 @@ class DriveTool:
             if folder_id:
                 file_metadata['parents'] = [folder_id]
             
-            # Upload file
-            result = service.files().create(
+            # Upload file - large files go up in resumable chunks instead of one buffered request
+            request = service.files().create(
                 body=file_metadata,
                 media_body=media,
                 fields='id,name,size,mimeType,webViewLink,webContentLink'
-            ).execute()
+            )
+            if resumable:
+                result = None
+                while result is None:
+                    status, result = request.next_chunk()
+            else:
+                result = request.execute()
             
             # Make public if requested
             if make_public:
@@ -77,12 +92,7 @@ class DriveTool:
             }
             
         except Exception as e:
-            return {
-                'success': False,
-                'data': None,
-                'error': str(e),
-                'message': f"Failed to upload file: {str(e)}"
-            }
+            return failure_result(e, "Failed to upload file")
     
     def search_files(self, google_client, query: Optional[str] = None,
                     file_type: Optional[str] = None, folder_id: Optional[str] = None,
@@ -150,12 +160,7 @@ class DriveTool:
             }
             
         except Exception as e:
-            return {
-                'success': False,
-                'data': None,
-                'error': str(e),
-                'message': f"Failed to search files: {str(e)}"
-            }
+            return failure_result(e, "Failed to search files")
     
     def download_file(self, google_client, file_id: str, 
                      download_path: Optional[str] = None) -> Dict[str, Any]:
@@ -173,18 +178,25 @@ class DriveTool:
             elif os.path.isdir(download_path):
                 download_path = os.path.join(download_path, filename)
             
-            # Download file
+            # Download to a temp file next to the target, one chunk in memory at a time, and only
+            # move it into place once complete - a failed download never leaves a partial file
             request = service.files().get_media(fileId=file_id)
-            file_io = io.BytesIO()
-            downloader = MediaIoBaseDownload(file_io, request)
-            
-            done = False
-            while done is False:
-                status, done = downloader.next_chunk()
-            
-            # Save to file
-            with open(download_path, 'wb') as f:
-                f.write(file_io.getvalue())
+            fd, temp_path = tempfile.mkstemp(
+                prefix=f".{os.path.basename(download_path)}.", suffix=".part",
+                dir=os.path.dirname(os.path.abspath(download_path))
+            )
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    downloader = MediaIoBaseDownload(f, request, chunksize=_CHUNK_SIZE)
+                    
+                    done = False
+                    while done is False:
+                        status, done = downloader.next_chunk()
+                
+                os.replace(temp_path, download_path)
+            except BaseException:
+                os.unlink(temp_path)
+                raise
             
             file_size = os.path.getsize(download_path)
             
@@ -201,12 +213,7 @@ class DriveTool:
             }
             
         except Exception as e:
-            return {
-                'success': False,
-                'data': None,
-                'error': str(e),
-                'message': f"Failed to download file: {str(e)}"
-            }
+            return failure_result(e, "Failed to download file")
     
     def share_file(self, google_client, file_id: str, 
                   email_addresses: Optional[List[str]] = None,
@@ -276,12 +283,7 @@ class DriveTool:
             }
             
         except Exception as e:
-            return {
-                'success': False,
-                'data': None,
-                'error': str(e),
-                'message': f"Failed to share file: {str(e)}"
-            }
+            return failure_result(e, "Failed to share file")
     
     def list_recent_files(self, google_client, max_results: int = 20,
                          file_types: Optional[List[str]] = None) -> Dict[str, Any]:
@@ -345,12 +347,7 @@ class DriveTool:
             }
             
         except Exception as e:
-            return {
-                'success': False,
-                'data': None,
-                'error': str(e),
-                'message': f"Failed to list recent files: {str(e)}"
-            }
+            return failure_result(e, "Failed to list recent files")
     
     def get_file_info(self, google_client, file_id: str) -> Dict[str, Any]:
         """Get detailed information about a specific file"""
@@ -379,12 +376,7 @@ class DriveTool:
             }
             
         except Exception as e:
-            return {
-                'success': False,
-                'data': None,
-                'error': str(e),
-                'message': f"Failed to get file info: {str(e)}"
-            }
+            return failure_result(e, "Failed to get file info")
     
     def _make_file_public(self, service, file_id: str):
         """Make file publicly accessible"""
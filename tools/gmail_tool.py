@@ -4,11 +4,27 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
 from email import encoders
+import logging
 import os
 from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional, Union
+from typing import List, Dict, Any, Optional, Set, Union
+from google.auth.exceptions import RefreshError
+from googleapiclient.errors import HttpError
+from tools.tool_result import failure_result
 import mimetypes
 
+logger = logging.getLogger(__name__)
+
+# Gmail accepts 100 calls per batch request but rate-limits batches larger than 50
+_BATCH_LIMIT = 50
+
+# Batched calls that fail with these statuses are re-sent on their own, with googleapiclient's backoff
+_RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+_ITEM_RETRIES = 3
+
+# Batched calls that fail with these statuses fail the whole call - the user must sign in or grant access again
+_AUTH_STATUSES = frozenset({401, 403})
+
 class GmailTool:
     """Gmail operations tool with optional attachment support"""
     
@@ -127,12 +143,7 @@ class GmailTool:
             }
             
         except Exception as e:
-            return {
-                'success': False,
-                'data': None,
-                'error': str(e),
-                'message': f"Failed to send email: {str(e)}"
-            }
+            return failure_result(e, "Failed to send email")
     
     def read_recent_emails(self, google_client, max_results: int = 10, 
                           query: Optional[str] = None,
@@ -150,12 +161,7 @@ class GmailTool:
             ).execute()
             
             messages = results.get('messages', [])
-            emails = []
-            
-            for msg in messages:
-                email_data = self._get_email_details(service, msg['id'], include_attachments)
-                if email_data:
-                    emails.append(email_data)
+            emails = self._get_emails_details(service, [msg['id'] for msg in messages], include_attachments)
             
             return {
                 'success': True,
@@ -168,12 +174,7 @@ class GmailTool:
             }
             
         except Exception as e:
-            return {
-                'success': False,
-                'data': None,
-                'error': str(e),
-                'message': f"Failed to read emails: {str(e)}"
-            }
+            return failure_result(e, "Failed to read emails")
     
     def search_emails_by_filters(self, google_client,
                                 sender: Optional[str] = None,
@@ -222,12 +223,7 @@ class GmailTool:
             ).execute()
             
             messages = results.get('messages', [])
-            emails = []
-            
-            for msg in messages:
-                email_data = self._get_email_details(service, msg['id'], include_attachments)
-                if email_data:
-                    emails.append(email_data)
+            emails = self._get_emails_details(service, [msg['id'] for msg in messages], include_attachments)
             
             return {
                 'success': True,
@@ -241,12 +237,7 @@ class GmailTool:
             }
             
         except Exception as e:
-            return {
-                'success': False,
-                'data': None,
-                'error': str(e),
-                'message': f"Failed to search emails: {str(e)}"
-            }
+            return failure_result(e, "Failed to search emails")
     
     def get_email_threads(self, google_client,
                          thread_id: Optional[str] = None,
@@ -259,7 +250,7 @@ class GmailTool:
             if thread_id:
                 # Get specific thread
                 thread = service.users().threads().get(userId='me', id=thread_id).execute()
-                threads_data = [self._process_thread(service, thread, include_attachments)]
+                threads_data = [self._process_thread(thread, include_attachments)]
             
             elif query:
                 # Search for threads
@@ -270,14 +261,15 @@ class GmailTool:
                 ).execute()
                 
                 threads = results.get('threads', [])
-                threads_data = []
-                
-                for thread in threads:
-                    thread_details = service.users().threads().get(
-                        userId='me', 
-                        id=thread['id']
-                    ).execute()
-                    threads_data.append(self._process_thread(service, thread_details, include_attachments))
+                thread_requests = [
+                    service.users().threads().get(userId='me', id=thread['id'])
+                    for thread in threads
+                ]
+                threads_data = [
+                    self._process_thread(thread_details, include_attachments)
+                    for thread_details in self._execute_batched(service, thread_requests)
+                    if thread_details is not None
+                ]
             
             else:
                 return {
@@ -298,18 +290,75 @@ class GmailTool:
             }
             
         except Exception as e:
-            return {
-                'success': False,
-                'data': None,
-                'error': str(e),
-                'message': f"Failed to get threads: {str(e)}"
-            }
+            return failure_result(e, "Failed to get threads")
+    
+    def _execute_batched(self, service, requests: List[Any]) -> List[Optional[Dict[str, Any]]]:
+        """Execute read requests through the batch endpoint, one HTTP round trip per _BATCH_LIMIT requests"""
+        responses: List[Optional[Dict[str, Any]]] = [None] * len(requests)
+        retry: Set[int] = set()
+        auth_errors: List[Exception] = []
+        
+        def collect(request_id, response, exception):
+            index = int(request_id)
+            if exception is None:
+                responses[index] = response
+            elif isinstance(exception, HttpError) and exception.resp.status in _RETRYABLE_STATUSES:
+                retry.add(index)
+            elif isinstance(exception, RefreshError) or (
+                    isinstance(exception, HttpError) and exception.resp.status in _AUTH_STATUSES):
+                auth_errors.append(exception)
+            else:
+                logger.warning("Gmail batch item %s failed: %s", index, exception)
+        
+        for start in range(0, len(requests), _BATCH_LIMIT):
+            chunk = range(start, min(start + _BATCH_LIMIT, len(requests)))
+            try:
+                batch = service.new_batch_http_request(callback=collect)
+                for index in chunk:
+                    batch.add(requests[index], request_id=str(index))
+                batch.execute()
+            except RefreshError:
+                raise
+            except Exception as e:
+                # Batch endpoint unavailable - fall back to one call per request
+                logger.warning("Gmail batch request failed, fetching individually: %s", e)
+                retry.update(index for index in chunk if responses[index] is None)
+            
+            # Every later item would fail the same way - don't report success with messages missing
+            if auth_errors:
+                raise auth_errors[0]
+        
+        # Rate-limited or failed items get their own call, retried with exponential backoff
+        for index in sorted(retry):
+            try:
+                responses[index] = requests[index].execute(num_retries=_ITEM_RETRIES)
+            except HttpError as item_error:
+                if item_error.resp.status in _AUTH_STATUSES:
+                    raise
+                logger.warning("Gmail request %s failed after retries: %s", index, item_error)
+        
+        missing = responses.count(None)
+        if missing:
+            logger.warning("%s of %s Gmail messages could not be fetched", missing, len(requests))
+        
+        return responses
+    
+    def _get_emails_details(self, service, message_ids: List[str], include_attachments: bool = False) -> List[Dict[str, Any]]:
+        """Get detailed information for several emails with batched fetches, keeping list order"""
+        requests = [service.users().messages().get(userId='me', id=message_id) for message_id in message_ids]
+        emails = []
+        
+        for message in self._execute_batched(service, requests):
+            if message is not None:
+                email_data = self._format_email_details(message, include_attachments)
+                if email_data:
+                    emails.append(email_data)
+        
+        return emails
     
-    def _get_email_details(self, service, message_id: str, include_attachments: bool = False) -> Dict[str, Any]:
-        """Get detailed email information"""
+    def _format_email_details(self, message: Dict, include_attachments: bool = False) -> Dict[str, Any]:
+        """Format a fetched Gmail message into email details"""
         try:
-            message = service.users().messages().get(userId='me', id=message_id).execute()
-            
             headers = {h['name']: h['value'] for h in message['payload'].get('headers', [])}
             
             # Extract body
@@ -380,12 +429,13 @@ class GmailTool:
         
         return attachments
     
-    def _process_thread(self, service, thread: Dict, include_attachments: bool = False) -> Dict[str, Any]:
+    def _process_thread(self, thread: Dict, include_attachments: bool = False) -> Dict[str, Any]:
         """Process thread data"""
         messages = []
         
+        # threads().get already returns full message payloads - no need to fetch each again
         for message in thread['messages']:
-            email_data = self._get_email_details(service, message['id'], include_attachments)
+            email_data = self._format_email_details(message, include_attachments)
             if email_data:
                 messages.append(email_data)
         
@@ -0,0 +1,17 @@
+from typing import Dict, Any
+from google.auth.exceptions import RefreshError
+from googleapiclient.errors import HttpError
+
+def failure_result(error: Exception, message: str) -> Dict[str, Any]:
+    """Result dict for a tool call that raised - Google API errors are re-raised instead"""
+    
+    # Left to ExecutionNode, which tells transient, auth and fatal API errors apart
+    if isinstance(error, (HttpError, RefreshError)):
+        raise error
+    
+    return {
+        'success': False,
+        'data': None,
+        'error': str(error),
+        'message': f"{message}: {str(error)}"
+    }